@@ -0,0 +1,44 @@
+-- =====================================================================
+-- Кодек ZSTD(6) на широких строковых колонках уже существующих таблиц
+-- (в stg_daily_codes_history.sql он задан сразу при создании).
+--
+-- Зачем: текстовые колонки (j, ch, pvad, ag, pn, b) под ZSTD занимают заметно меньше,
+-- чем под LZ4 по умолчанию, — меньше I/O на слияниях и на INSERT ... SELECT дедупа
+-- в BUF / REPLACE PARTITION в CLEAN.
+--
+-- ВАЖНО:
+--   • MODIFY COLUMN с тем же типом и новым кодеком — только метаданные: уже записанные
+--     куски перекодируются фоновыми слияниями (или OPTIMIZE ... FINAL на нужные партиции);
+--   • RAW, BUF и CLEAN меняем одинаково — REPLACE PARTITION ждёт совпадающую структуру;
+--   • Distributed-таблицы данных не хранят — их не трогаем;
+--   • выполнять в окно без активного ETL (публикация не должна идти параллельно с ALTER).
+-- Пример запуска:
+--   clickhouse-client -n --queries-file=ddl/ch_codecs_zstd.sql
+-- =====================================================================
+
+-- RAW
+ALTER TABLE stg.daily_codes_history_raw ON CLUSTER shardless
+    MODIFY COLUMN ch   Array(String)    DEFAULT [] CODEC(ZSTD(6)),
+    MODIFY COLUMN j    Nullable(String) CODEC(ZSTD(6)),
+    MODIFY COLUMN pvad Nullable(String) CODEC(ZSTD(6)),
+    MODIFY COLUMN ag   Nullable(String) CODEC(ZSTD(6)),
+    MODIFY COLUMN pn   Nullable(String) CODEC(ZSTD(6)),
+    MODIFY COLUMN b    Nullable(String) CODEC(ZSTD(6));
+
+-- BUF (дедуп)
+ALTER TABLE stg.daily_codes_history_dedup_buf ON CLUSTER shardless
+    MODIFY COLUMN ch   Array(String)    DEFAULT [] CODEC(ZSTD(6)),
+    MODIFY COLUMN j    Nullable(String) CODEC(ZSTD(6)),
+    MODIFY COLUMN pvad Nullable(String) CODEC(ZSTD(6)),
+    MODIFY COLUMN ag   Nullable(String) CODEC(ZSTD(6)),
+    MODIFY COLUMN pn   Nullable(String) CODEC(ZSTD(6)),
+    MODIFY COLUMN b    Nullable(String) CODEC(ZSTD(6));
+
+-- CLEAN
+ALTER TABLE stg.daily_codes_history ON CLUSTER shardless
+    MODIFY COLUMN ch   Array(String)    DEFAULT [] CODEC(ZSTD(6)),
+    MODIFY COLUMN j    Nullable(String) CODEC(ZSTD(6)),
+    MODIFY COLUMN pvad Nullable(String) CODEC(ZSTD(6)),
+    MODIFY COLUMN ag   Nullable(String) CODEC(ZSTD(6)),
+    MODIFY COLUMN pn   Nullable(String) CODEC(ZSTD(6)),
+    MODIFY COLUMN b    Nullable(String) CODEC(ZSTD(6));
@@ -0,0 +1,35 @@
+-- =====================================================================
+-- Перевод партиций журнала ETL в UNLOGGED (без WAL на planned/running/ok/heartbeat).
+-- Новые партиции при JOURNAL_UNLOGGED=1 создаются UNLOGGED самим ProcessJournal.ensure();
+-- этот скрипт — разовая миграция уже существующих дочерних таблиц.
+--
+-- ВАЖНО:
+--   • родитель (PARTITION BY RANGE) данных не хранит — меняем только дочерние партиции;
+--   • таблицу состояния public.inc_process_state НЕ трогаем: в ней watermark (last_ok_end),
+--     он должен переживать crash PostgreSQL;
+--   • после аварийного рестарта UNLOGGED-партиции будут пустыми — это допустимо: следующий
+--     запуск продолжит с watermark, «зависших» planned/running просто не останется;
+--   • SET UNLOGGED переписывает таблицу — выполнять в окно без активного ETL.
+-- Пример запуска:
+--   psql "$PG_DSN" -v ON_ERROR_STOP=1 -f pg_journal_unlogged.sql
+-- =====================================================================
+DO $$
+DECLARE
+    r record;
+BEGIN
+    FOR r IN
+        SELECT n.nspname AS sch, c.relname AS rel
+          FROM pg_inherits i
+          JOIN pg_class c     ON c.oid = i.inhrelid
+          JOIN pg_class p     ON p.oid = i.inhparent
+          JOIN pg_namespace n ON n.oid = c.relnamespace
+          JOIN pg_namespace pn ON pn.oid = p.relnamespace
+         WHERE pn.nspname = 'public'
+           AND p.relname = 'inc_processing'
+           AND c.relpersistence = 'p'
+    LOOP
+        EXECUTE format('ALTER TABLE %I.%I SET UNLOGGED', r.sch, r.rel);
+        RAISE NOTICE 'UNLOGGED: %.%', r.sch, r.rel;
+    END LOOP;
+END
+$$;
@@ -40,8 +40,8 @@ CREATE TABLE stg.daily_codes_history_raw ON CLUSTER shardless
     p    Nullable(String),
     pt   Nullable(UInt8),
     o    Nullable(String),
-    pn   Nullable(String),
-    b    Nullable(String),
+    pn   Nullable(String) CODEC(ZSTD(6)),
+    b    Nullable(String) CODEC(ZSTD(6)),
     tt   Nullable(Int64),
     tm   Nullable(DateTime64(3, {tz_utc:String})),
     tm_local Nullable(DateTime64(3, {tz_local:String})) ALIAS if(isNull(tm), NULL, toTimeZone(tm, {tz_local:String})),
@@ -59,6 +59,8 @@ CREATE TABLE stg.daily_codes_history_raw ON CLUSTER shardless
     INDEX idx_opd_local_date (opd_local_date) TYPE minmax GRANULARITY 1
 )
 ENGINE = ReplicatedMergeTree('/clickhouse/tables/stg.daily_codes_history_raw', {repl_macro:String})
+-- Для CH_PUBLISH_DEDUP_MODE=final движок RAW должен схлопывать дубли сам (версия — ingested_at):
+-- ENGINE = ReplicatedReplacingMergeTree('/clickhouse/tables/stg.daily_codes_history_raw', {repl_macro:String}, ingested_at)
 PARTITION BY toYYYYMMDD(opd)
 ORDER BY (c, opd, t)
 TTL ingested_at + INTERVAL 5 DAY DELETE
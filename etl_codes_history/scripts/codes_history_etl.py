@@ -19,7 +19,11 @@ Incremental ETL: Phoenix(HBase) → ClickHouse (native 9000, с компресс
 
 Каденс публикаций
 -----------------
-• Публикация управляется ТОЛЬКО числом успешных слайсов: PUBLISH_EVERY_SLICES.
+• Промежуточная публикация срабатывает по первому из порогов: число успешных слайсов
+  (PUBLISH_EVERY_SLICES), объём новых строк с прошлой публикации (PUBLISH_EVERY_ROWS)
+  или время с прошлой публикации (PUBLISH_EVERY_SEC); 0 — порог выключен.
+• PUBLISH_MAX_PENDING_PARTS ограничивает число накопленных неопубликованных партиций:
+  при достижении публикация выполняется досрочно.
 • В конце запуска всегда выполняется финальная публикация (ALWAYS_PUBLISH_AT_END зафиксирован).
 • Для защиты от «пустых» публикаций действует лёгкий гейтинг: считаем «новые» строки в памяти
   по каждой партиции в рамках текущего запуска и публикуем партицию только если новых строк
@@ -64,8 +68,8 @@ import socket
 import signal
 from collections import defaultdict
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-from time import perf_counter
+from datetime import datetime, timedelta, timezone
+from time import monotonic, perf_counter
 from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, cast, TYPE_CHECKING
 
 # psycopg UniqueViolation — для защиты mark_planned от гонки
@@ -77,7 +81,7 @@ except Exception:  # pragma: no cover
 
 # Настройка логов/конфиг/диагностика
 from .logging_setup import setup_logging
-from .config import Settings
+from .config import Settings, get_settings
 from .diag import want_trace, log_maybe_trace, log_window_hints
 
 # Выбор слайсера (UTC-сетка предпочтительнее)
@@ -90,7 +94,7 @@ except Exception:  # pragma: no cover
 from .db.phoenix_client import PhoenixClient
 from .db.pg_client import PGClient, PGConnectionError
 from .db.clickhouse_client import ClickHouseClient as CHClient
-from .journal import ProcessJournal
+from .journal import DoneBuffer, ProcessJournal
 
 # --- Импорты из вынесенных модулей (слои ответственности) ---
 
@@ -100,31 +104,25 @@ from .publishing import (
     perform_startup_backfill,
     select_parts_to_publish,
     log_gating_debug,
+    BackgroundPublisher,
 )
 
 # Слайсинг/обработка (горячий путь)
 from .slices import (
     process_one_slice,
+    SlicePrefetcher,
     row_to_ch_tuple,
     opd_to_part_utc,
     resolve_phx_table_and_cols,
 )
 
-# Бутстрап/инициализация (PG/оконный контекст/подключения)
-from .bootstrap import (
-    connect_pg_and_journal,
-    startup_fail_with_journal,
-    connect_phx_client,
-    connect_ch_client,
-    ensure_ch_tables_or_fail,
-    required_ch_tables,
-    bootstrap_pg_and_window,
-    init_backends_and_check,
-)
+# Стартовые сбои компонентов (лог + журнал)
+from .bootstrap import startup_fail_with_journal
 
 # Время/TZ и расчёт границ слайса для Phoenix
 from .timeutils import (
     compute_phx_slice_and_log,
+    parse_cli_dt,
 )
 
 log = logging.getLogger("codes_history_increment")
@@ -213,9 +211,41 @@ class ExecParams:
     phx_table: str
     phx_ts_col: str
     phx_cols: Tuple[str, ...]
+    # Размерные пороги промежуточной публикации (0 — выключено)
+    publish_every_rows: int = 0
+    publish_every_sec: int = 0
+    publish_max_pending_parts: int = 0
 
 # ------------------------ Оркестрация: публикация по порогу -------------------
 
+def _publish_due(
+    *,
+    pending_parts: Set[int],
+    new_rows_by_part: Dict[int, int],
+    publish_every_slices: int,
+    slices_since_last_pub: int,
+    publish_every_rows: int,
+    publish_every_sec: int,
+    last_publish_mono: float,
+    publish_max_pending_parts: int = 0,
+) -> bool:
+    """
+    Пора ли промежуточной публикации: по числу слайсов, по числу новых строк с прошлой
+    публикации (счётчики по партициям уже ведутся для гейтинга) или по времени.
+    Так редкие «тонкие» слайсы не публикуются слишком часто, а плотные — не копятся долго.
+    Отдельный предохранитель — число накопленных партиций (память и размер финальной публикации).
+    """
+    if publish_every_slices > 0 and slices_since_last_pub >= publish_every_slices:
+        return True
+    if not pending_parts:
+        return False
+    if publish_max_pending_parts > 0 and len(pending_parts) >= publish_max_pending_parts:
+        return True
+    if publish_every_rows > 0 and sum(new_rows_by_part.values()) >= publish_every_rows:
+        return True
+    return publish_every_sec > 0 and (monotonic() - last_publish_mono) >= publish_every_sec
+
+
 def _maybe_intermediate_publish(
     *,
     pending_parts: Set[int],
@@ -229,18 +259,39 @@ def _maybe_intermediate_publish(
     pg: "PGClient",
     process_name: str,
     after_publish: Callable[[Set[int]], None],
+    publisher: Optional["BackgroundPublisher"] = None,
+    publish_every_rows: int = 0,
+    publish_every_sec: int = 0,
+    last_publish_mono: float = 0.0,
+    publish_max_pending_parts: int = 0,
 ) -> bool:
-    """Промежуточная публикация при достижении порога слайсов."""
-    if publish_every_slices <= 0 or slices_since_last_pub < publish_every_slices:
-        return False
-
-    log_gating_debug(
+    """
+    Промежуточная публикация при достижении любого из порогов (см. _publish_due).
+    С publisher публикация ставится в фоновый поток, а состояние гейтинга сбрасывается сразу
+    (неудачные партиции вернёт publisher.drain_failed()).
+    """
+    if not _publish_due(
         pending_parts=pending_parts,
         new_rows_by_part=new_rows_by_part,
-        publish_min_new_rows=publish_min_new_rows,
-        slices_since_last_pub=slices_since_last_pub,
         publish_every_slices=publish_every_slices,
-    )
+        slices_since_last_pub=slices_since_last_pub,
+        publish_every_rows=publish_every_rows,
+        publish_every_sec=publish_every_sec,
+        last_publish_mono=last_publish_mono,
+        publish_max_pending_parts=publish_max_pending_parts,
+    ):
+        return False
+
+    # DEBUG-диагностика гейтинга: проверяем уровень до вызова, чтобы на INFO не собирать kwargs
+    # и не делать лишний вызов функции на каждом пороге публикации.
+    if log.isEnabledFor(logging.DEBUG):
+        log_gating_debug(
+            pending_parts=pending_parts,
+            new_rows_by_part=new_rows_by_part,
+            publish_min_new_rows=publish_min_new_rows,
+            slices_since_last_pub=slices_since_last_pub,
+            publish_every_slices=publish_every_slices,
+        )
 
     parts_to_publish = select_parts_to_publish(
         pending_parts=pending_parts,
@@ -255,6 +306,12 @@ def _maybe_intermediate_publish(
         )
         return False
 
+    if publisher is not None:
+        publisher.submit(parts_to_publish)
+        log.info("Промежуточная публикация поставлена в фон: %d партиций.", len(parts_to_publish))
+        after_publish(parts_to_publish)
+        return True
+
     if publish_parts(ch, cfg, pg, process_name, parts_to_publish):
         log.info("Промежуточная публикация: %d партиций.", len(parts_to_publish))
         after_publish(parts_to_publish)
@@ -294,24 +351,23 @@ def _plan_run_with_heartbeat(
 
     run_id = mark_running(s, e, host=host, pid=pid)
 
+    # Heartbeat коалесцируется: вызовы из горячего пути (после каждого чанка вставки) лишь
+    # сравнивают время с дедлайном, а в PG уходит не больше одного UPSERT за интервал (≥ 5 с).
+    # Стартовый heartbeat не шлём: mark_running уже записал heartbeat_ts и статус running.
     if hb_interval_sec < 5:
         hb_interval_sec = 5
     _next_deadline = perf_counter() + hb_interval_sec
 
-    try:
-        journal.heartbeat(run_id, progress={"rows_read": 0, "rows_written": total_written_ch})
-    except Exception:
-        pass
-
     def maybe_hb(rows_read: int, total_written: int) -> None:
         nonlocal _next_deadline
         nowp = perf_counter()
-        if nowp >= _next_deadline:
-            try:
-                journal.heartbeat(run_id, progress={"rows_read": rows_read, "rows_written": total_written})
-            except Exception:
-                pass
-            _next_deadline = nowp + hb_interval_sec
+        if nowp < _next_deadline:
+            return
+        _next_deadline = nowp + hb_interval_sec
+        try:
+            journal.heartbeat(run_id, progress={"rows_read": rows_read, "rows_written": total_written})
+        except Exception:
+            pass
 
     return run_id, maybe_hb
 
@@ -331,16 +387,23 @@ def _run_one_slice_and_maybe_publish(
     pending_parts: Set[int],
     new_rows_since_pub_by_part: Dict[int, int],
     after_publish: Callable[[Set[int]], None],
+    publisher: Optional["BackgroundPublisher"] = None,
+    prefetcher: Optional["SlicePrefetcher"] = None,
+    next_slice: Optional[Tuple[datetime, datetime]] = None,
+    last_publish_mono: float = 0.0,
+    done_buffer: Optional[DoneBuffer] = None,
 ) -> Tuple[int, int, bool, bool, int, int]:
     """
     Выполняет цикл обработки одного слайса: планирование, чтение Phoenix,
     batch-вставки в RAW, промежуточную публикацию и mark_done.
+    С prefetcher: окно берётся из предвыборки (если она совпала), а после записи в RAW
+    запускается предвыборка next_slice — она идёт параллельно публикации и mark_done.
     Возвращает:
         rows_read, written_now, is_first_slice, logged_tz_context, slices_since_last_pub, total_written_ch
     """
-    compute_slice: Callable[[datetime, datetime, bool, timedelta, str, bool], Tuple[datetime, datetime, bool]] = _compute_phx_slice_and_log
+    compute_slice: Callable[[datetime, datetime, bool, timedelta, str, bool], Tuple[datetime, datetime, bool]] = compute_phx_slice_and_log
     plan_run: Callable[[ProcessJournal, datetime, datetime, str, int, int, int], Tuple[int, Callable[[int, int], None]]] = _plan_run_with_heartbeat
-    process_slice: Callable[..., Tuple[int, int]] = _process_one_slice
+    process_slice: Callable[..., Tuple[int, int]] = process_one_slice
     intermediate_publish: Callable[..., bool] = _maybe_intermediate_publish
     journal = params.journal
     cfg = params.cfg
@@ -350,7 +413,7 @@ def _run_one_slice_and_maybe_publish(
     log_local = log
 
     # Методы журнала (горячий путь)
-    mark_done: Callable[..., Optional[int]] = journal.mark_done
+    mark_done: Callable[..., Optional[int]] = done_buffer if done_buffer is not None else journal.mark_done
     mark_error: Callable[..., Optional[int]] = journal.mark_error
     heartbeat: Callable[..., None] = journal.heartbeat
     mark_cancelled: Optional[Callable[..., Optional[int]]] = getattr(journal, "mark_cancelled", None)
@@ -388,19 +451,29 @@ def _run_one_slice_and_maybe_publish(
             s_q=s_q,
             e_q=e_q,
             phx_meta=(params.phx_table, params.phx_ts_col, params.phx_cols),
-            row_to_tuple=_row_to_ch_tuple,
-            opd_to_part=_opd_to_part_utc,
+            row_to_tuple=row_to_ch_tuple,
+            opd_to_part=opd_to_part_utc,
             insert_rows=insert_rows,
             maybe_hb=maybe_hb,
             new_rows_since_pub_by_part=new_rows_since_pub_by_part,
             pending_parts=pending_parts,
+            batches=prefetcher.take(s_q, e_q) if prefetcher is not None else None,
+            insert_columns=ch.insert_columns,
         )
         total_written_ch = total_written_ch + written_now
         slices_since_last_pub += 1
         is_first_slice = False
 
-        # 4) Промежуточная публикация ДО mark_done()
-        intermediate_publish(
+        if prefetcher is not None and next_slice is not None:
+            # Следующий слайс — никогда не первый: захлёста нет, TZ-контекст уже залогирован
+            n_s_q, n_e_q, _ = compute_slice(
+                next_slice[0], next_slice[1], False, params.overlap_delta, params.business_tz_name, True,
+            )
+            prefetcher.start(params.phx_table, params.phx_ts_col, params.phx_cols, n_s_q, n_e_q)
+
+        # 4) Промежуточная публикация ДО mark_done(); после неё счётчик слайсов обнуляется
+        # (after_publish сбрасывает внешний счётчик, но наружу возвращается локальный)
+        if intermediate_publish(
             pending_parts=pending_parts,
             new_rows_by_part=new_rows_since_pub_by_part,
             publish_every_slices=params.publish_every_slices,
@@ -409,21 +482,32 @@ def _run_one_slice_and_maybe_publish(
             publish_min_new_rows=params.publish_min_new_rows,
             ch=ch, cfg=cfg, pg=pg, process_name=proc_name,
             after_publish=after_publish,
-        )
+            publisher=publisher,
+            publish_every_rows=params.publish_every_rows,
+            publish_every_sec=params.publish_every_sec,
+            last_publish_mono=last_publish_mono,
+            publish_max_pending_parts=params.publish_max_pending_parts,
+        ):
+            slices_since_last_pub = 0
 
         # 5) Закрываем слайс
         mark_done(s, e, rows_read=rows_read, rows_written=total_written_ch)
-        _pp = ",".join(str(p) for p in sorted(pending_parts)) or "-"
-        log_local.info(
-            "Слайс завершён: %s → %s (PHX: %s → %s); rows_read=%d, rows_written_raw_total=%d, pending_parts=%s",
-            s.isoformat(),
-            e.isoformat(),
-            s_q.isoformat(),
-            e_q.isoformat(),
-            rows_read,
-            total_written_ch,
-            _pp,
-        )
+        if log_local.isEnabledFor(logging.INFO):
+            # Полный список — только для небольшого набора; на длинных бэкфиллах хватает min..max (count)
+            if len(pending_parts) <= 16:
+                _pp = ",".join(str(p) for p in sorted(pending_parts)) or "-"
+            else:
+                _pp = f"{min(pending_parts)}..{max(pending_parts)} ({len(pending_parts)})"
+            log_local.info(
+                "Слайс завершён: %s → %s (PHX: %s → %s); rows_read=%d, rows_written_raw_total=%d, pending_parts=%s",
+                s,
+                e,
+                s_q,
+                e_q,
+                rows_read,
+                total_written_ch,
+                _pp,
+            )
         return rows_read, written_now, is_first_slice, logged_tz_context, slices_since_last_pub, total_written_ch
 
     except KeyboardInterrupt:
@@ -475,12 +559,38 @@ def _execute_with_lock(params: ExecParams) -> Tuple[int, int]:
     ch_table_raw_all = cfg.CH_RAW_TABLE
     ch_batch = int(cfg.CH_INSERT_BATCH)
 
+    last_publish_mono = monotonic()
+
     def _after_publish_update_state(published: Set[int]) -> None:
-        nonlocal slices_since_last_pub
-        for p in published:
-            new_rows_since_pub_by_part[p] = 0
-            pending_parts.discard(p)
+        nonlocal slices_since_last_pub, last_publish_mono
+        # Массовые операции множества/словаря — итерация на C-уровне, без вызова на каждую партицию
+        new_rows_since_pub_by_part.update(dict.fromkeys(published, 0))
+        pending_parts.difference_update(published)
         slices_since_last_pub = 0
+        last_publish_mono = monotonic()
+
+    # Фоновая публикация (опционально): свои CH/PG-соединения, строго последовательная очередь
+    publisher: Optional[BackgroundPublisher] = None
+    if bool(getattr(cfg, "PUBLISH_IN_BACKGROUND", False)):
+        publisher = BackgroundPublisher(ch.clone, cfg, pg.clone, process_name)
+
+    # Пакетный UPSERT watermark'а при закрытии слайсов (1 — как раньше, на каждый слайс)
+    done_batch = int(getattr(cfg, "JOURNAL_DONE_BATCH", 1) or 1)
+    done_buffer: Optional[DoneBuffer] = DoneBuffer(journal, done_batch) if done_batch > 1 else None
+
+    # Предвыборка следующего слайса (опционально): своё Phoenix-соединение
+    prefetcher: Optional[SlicePrefetcher] = None
+    if bool(getattr(cfg, "PHX_PREFETCH_NEXT_SLICE", False)):
+        prefetcher = SlicePrefetcher(params.phx.clone, int(getattr(cfg, "ETL_PIPELINE_QUEUE", 0) or 0) or 4)
+
+    def _requeue_failed(wait: bool = False) -> None:
+        if publisher is None:
+            return
+        failed = publisher.drain_failed(wait=wait)
+        if failed:
+            log.warning("Фоновая публикация не удалась для партиций: %s — вернём их в очередь.",
+                        ", ".join(map(str, sorted(failed))))
+            pending_parts.update(failed)
 
     try:
         with exclusive_lock() as got:
@@ -498,27 +608,49 @@ def _execute_with_lock(params: ExecParams) -> Tuple[int, int]:
             # Лёгкий стартовый бэкфилл недопубликованных партиций
             perform_startup_backfill(ch=ch, cfg=cfg, until_dt=until_dt, process_name=process_name, pg=pg)
 
-            logged_tz_context = False
-            is_first_slice = True
+            slices = list(iter_slices(since_dt, until_dt, step_min))
+            n_slices = len(slices)
 
-            for s, e in iter_slices(since_dt, until_dt, step_min):
+            def _run_slice(i: int, first: bool) -> None:
+                nonlocal total_read, total_written_ch, slices_since_last_pub
+                s, e = slices[i]
                 check_stop()
-                rows_read, _, is_first_slice, logged_tz_context, slices_since_last_pub, total_written_ch = run_slice(
+                _requeue_failed()
+                rows_read, _, _, _, slices_since_last_pub, total_written_ch = run_slice(
                     params,
                     s,
                     e,
                     ch_table_raw_all=ch_table_raw_all,
                     ch_batch=ch_batch,
-                    logged_tz_context=logged_tz_context,
-                    is_first_slice=is_first_slice,
+                    # TZ-контекст логируется и захлёст применяется только на первом слайсе
+                    logged_tz_context=not first,
+                    is_first_slice=first,
                     slices_since_last_pub=slices_since_last_pub,
                     total_written_ch=total_written_ch,
                     pending_parts=pending_parts,
                     new_rows_since_pub_by_part=new_rows_since_pub_by_part,
                     after_publish=_after_publish_update_state,
+                    publisher=publisher,
+                    prefetcher=prefetcher,
+                    next_slice=slices[i + 1] if i + 1 < n_slices else None,
+                    last_publish_mono=last_publish_mono,
+                    done_buffer=done_buffer,
                 )
                 total_read += rows_read
 
+            # Первый слайс — отдельно (захлёст + TZ-контекст), остальные — прямой цикл без флагов
+            if n_slices:
+                _run_slice(0, True)
+            for i in range(1, n_slices):
+                _run_slice(i, False)
+
+            if done_buffer is not None:
+                done_buffer.flush()
+
+            # Дожидаемся фоновых публикаций до финальной: порядок REPLACE сохраняется,
+            # а неудачные партиции попадут в финальный набор.
+            _requeue_failed(wait=True)
+
             # Финальная публикация (и опциональный добор пропущенных партиций)
             if always_publish_at_end:
                 finalize_pub(
@@ -533,8 +665,16 @@ def _execute_with_lock(params: ExecParams) -> Tuple[int, int]:
                     new_rows_since_pub_by_part=new_rows_since_pub_by_part,
                 )
     finally:
-        # Пустой finally для корректной формы try-блока.
-        pass
+        if done_buffer is not None:
+            # Watermark уже закрытых слайсов фиксируем и при ошибке/прерывании следующего
+            try:
+                done_buffer.flush()
+            except Exception:
+                log.warning("Не удалось зафиксировать watermark накопленных слайсов.", exc_info=True)
+        if prefetcher is not None:
+            prefetcher.close()
+        if publisher is not None:
+            publisher.close()
     return total_read, total_written_ch
 
 # ------------------------ Обвязка запуска -------------------------------------
@@ -563,9 +703,101 @@ def _make_startup_fail_handler(
 ):
     """Фабрика колбэка для единообразной обработки стартовых ошибок компонентов."""
     def _on_fail(component: str, exc: Exception, extra: Optional[Dict[str, Any]] = None) -> None:
-        _startup_fail_with_journal(journal, since_dt, until_dt, cfg, component, exc, extra)
+        message = f"{component} connect/init failed"
+        if extra:
+            message += " (" + ", ".join(f"{k}={v}" for k, v in extra.items()) + ")"
+        startup_fail_with_journal(
+            journal,
+            slice_from=since_dt,
+            slice_to=until_dt,
+            message=message,
+            component=component,
+            exc=exc,
+        )
     return _on_fail
 
+def _bootstrap_pg_and_window(
+    cfg: "Settings",
+    args: argparse.Namespace,
+    process_name: str,
+) -> Tuple["PGClient", "ProcessJournal", datetime, datetime, bool, bool, int, str, Callable[..., None]]:
+    """
+    PG + журнал и окно запуска [since, until):
+      • since не задан — берём watermark журнала (last_ok_end);
+      • until не задан — since + RUN_WINDOW_HOURS, но не дальше текущего момента.
+    Наивные даты CLI трактуются в BUSINESS_TZ (если задана), иначе в UTC.
+    Возвращает (pg, journal, since_dt, until_dt, used_watermark, auto_until, auto_window_hours,
+    business_tz_name, on_startup_fail). При ошибке PG закрывается.
+    """
+    business_tz_name = str(getattr(cfg, "BUSINESS_TZ", "") or "").strip()
+    mode = "business" if business_tz_name else "utc"
+    business_tz_name = business_tz_name or "UTC"
+    auto_window_hours = int(getattr(cfg, "RUN_WINDOW_HOURS", 24) or 24)
+
+    # Разбираем CLI до подключения: ошибка формата не должна открывать соединение
+    since_dt = parse_cli_dt(args.since, mode, business_tz_name)
+    until_dt = parse_cli_dt(args.until, mode, business_tz_name)
+
+    pg = PGClient(cfg.PG_DSN)
+    try:
+        journal = ProcessJournal(pg, cfg.JOURNAL_TABLE, process_name)
+        journal.ensure()
+
+        used_watermark = since_dt is None
+        if since_dt is None:
+            since_dt = journal.get_watermark()
+            if since_dt is None:
+                raise SystemExit("--since не указан, а watermark в журнале отсутствует — укажите --since.")
+
+        auto_until = until_dt is None
+        if until_dt is None:
+            until_dt = min(since_dt + timedelta(hours=auto_window_hours), datetime.now(timezone.utc))
+        elif until_dt <= since_dt:
+            raise SystemExit(f"Пустое окно: --until ({until_dt}) должен быть позже --since ({since_dt}).")
+    except BaseException:
+        _close_quietly(pg)
+        raise
+
+    on_startup_fail = _make_startup_fail_handler(journal, since_dt, until_dt, cfg)
+    return (
+        pg, journal, since_dt, until_dt, used_watermark, auto_until, auto_window_hours,
+        business_tz_name, on_startup_fail,
+    )
+
+def _init_backends_and_check(
+    cfg: "Settings",
+    on_startup_fail: Callable[..., None],
+) -> Tuple["PhoenixClient", "CHClient"]:
+    """
+    Подключения к Phoenix и ClickHouse + ранняя проверка таблиц CH (RAW/CLEAN/BUF).
+    Сбой компонента уходит в on_startup_fail и пробрасывается; уже открытые клиенты закрываются.
+    """
+    try:
+        phx = PhoenixClient(cfg.PQS_URL, fetchmany_size=int(cfg.PHX_FETCHMANY_SIZE))
+    except Exception as ex:
+        on_startup_fail("phoenix", ex, {"url": cfg.PQS_URL})
+        raise
+
+    ch: Optional[CHClient] = None
+    try:
+        ch = CHClient(
+            hosts=cfg.ch_hosts_list(),
+            port=cfg.CH_PORT,
+            database=cfg.CH_DB,
+            user=cfg.CH_USER,
+            password=cfg.CH_PASSWORD,
+            cluster=cfg.CH_CLUSTER or None,
+        )
+        ch.ensure_tables(
+            [cfg.CH_RAW_TABLE, cfg.CH_CLEAN_TABLE, cfg.CH_DEDUP_BUF_TABLE],
+            cluster=cfg.CH_CLUSTER or None,
+        )
+    except Exception as ex:
+        _close_quietly(ch, phx)
+        on_startup_fail("clickhouse", ex, {"hosts": cfg.CH_HOSTS})
+        raise
+    return phx, ch
+
 # ------------------------ Вынесенный heavy ETL-процесс ------------------------
 
 def _run_etl_impl(args: argparse.Namespace) -> None:
@@ -574,7 +806,7 @@ def _run_etl_impl(args: argparse.Namespace) -> None:
     _reduce_noise_for_info_mode()
     if getattr(args, "profile", False):
         os.environ["ETL_PROFILE"] = "1"
-    cfg = Settings()
+    cfg = get_settings()
     _install_signal_handlers()
 
     manual_mode = bool(args.manual_start)
@@ -597,7 +829,7 @@ def _run_etl_impl(args: argparse.Namespace) -> None:
             business_tz_name,
             on_startup_fail,
         ) = _bootstrap_pg_and_window(cfg, args, process_name)
-        _log_window_hints(used_watermark, auto_until, auto_window_hours)
+        log_window_hints(used_watermark, auto_until, auto_window_hours)
 
         # Подключения к Phoenix/CH и ранняя проверка таблиц
         phx, ch = _init_backends_and_check(cfg, on_startup_fail)
@@ -625,7 +857,7 @@ def _run_etl_impl(args: argparse.Namespace) -> None:
         pid = os.getpid()
 
         # Предразрешаем Phoenix-метаданные (таблица/TS-столбец/набор колонок)
-        phx_table, phx_ts_col, phx_cols = _resolve_phx_table_and_cols(cfg)
+        phx_table, phx_ts_col, phx_cols = resolve_phx_table_and_cols(cfg)
 
         # Основной сценарий под журнал-lock
         params = ExecParams(
@@ -650,6 +882,9 @@ def _run_etl_impl(args: argparse.Namespace) -> None:
             phx_table=phx_table,
             phx_ts_col=phx_ts_col,
             phx_cols=phx_cols,
+            publish_every_rows=int(getattr(cfg, "PUBLISH_EVERY_ROWS", 0) or 0),
+            publish_every_sec=int(getattr(cfg, "PUBLISH_EVERY_SEC", 0) or 0),
+            publish_max_pending_parts=int(getattr(cfg, "PUBLISH_MAX_PENDING_PARTS", 0) or 0),
         )
         total_read, total_written_ch = _execute_with_lock(params)
         log.info("Готово. Прочитано: %d | в CH записано: %d", total_read, total_written_ch)
@@ -694,10 +929,10 @@ if __name__ == "__main__":
         raise SystemExit(2)
     except Exception as unhandled:
         # На этом этапе cfg может быть ещё не создан — ориентируемся на ENV/уровень логгера
-        want_trace = _want_trace(None)
+        _trace = want_trace(None)
         _log = logging.getLogger("codes_history_increment")
         _msg = f"Необработанная ошибка: {unhandled.__class__.__name__}: {unhandled}"
-        if want_trace:
+        if _trace:
             _log.exception(_msg)
         else:
             _log.error(_msg + " (стек скрыт; установите ETL_TRACE_EXC=1 или запустите с --log-level=DEBUG, чтобы напечатать трейсбек)")
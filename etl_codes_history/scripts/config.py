@@ -24,8 +24,8 @@ import os
 #   3) <repo_root>/.env   (родитель каталога, где лежит scripts/)
 #   4) scripts/.env
 # Плюс, если PG_DSN не задан, собираем его из PG_HOST/PG_PORT/PG_DB/PG_USER/PG_PASSWORD.
-import logging as _logging, os as _os, pathlib as _pathlib
-from typing import List, Optional as _Optional
+import logging as _logging, os as _os, pathlib as _pathlib, re as _re
+from typing import List, Optional as _Optional, Tuple
 
 _log = _logging.getLogger(__name__)
 
@@ -62,21 +62,26 @@ def _load_env_try_dotenv(paths: List[_pathlib.Path]) -> _Optional[str]:
             continue
     return None
 
+# Строка .env: [export ]KEY=VALUE, значение — "в двойных", 'в одинарных' кавычках или как есть.
+# Одно совпадение на строку вместо split + цепочки strip; комментарии/пустые строки не совпадают.
+# Хвост « # комментарий» после значения отбрасывается, как в python-dotenv («a#b» без пробела — значение).
+_ENV_LINE_RE = _re.compile(
+    r"""^\s*(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)\s*=\s*(?:"([^"]*)"|'([^']*)'|(.*?))(?:\s+#.*)?\s*$"""
+)
+
 def _load_env_try_fallback(paths: List[_pathlib.Path]) -> _Optional[str]:
     """Простой парсер KEY=VALUE на случай отсутствия python-dotenv."""
+    match = _ENV_LINE_RE.match
     for p in paths:
         try:
             if not p.is_file():
                 continue
             for line in p.read_text(encoding="utf-8").splitlines():
-                line = line.strip()
-                if not line or line.startswith("#"):
+                m = match(line)
+                if m is None:
                     continue
-                if "=" in line:
-                    k, v = line.split("=", 1)
-                    k = k.strip()
-                    v = v.strip().strip('"').strip("'")
-                    _os.environ.setdefault(k, v)
+                k, dq, sq, raw = m.groups()
+                _os.environ.setdefault(k, dq if dq is not None else sq if sq is not None else raw)
             return str(p)
         except Exception:
             continue
@@ -115,6 +120,7 @@ _ensure_pg_dsn_in_env()
 # --- END robust .env loader (injected) ---
 
 from dataclasses import dataclass
+from functools import lru_cache as _lru_cache
 
 def _as_bool(v: str, default: bool = False) -> bool:
     s = (v or "").strip().lower()
@@ -140,6 +146,21 @@ def _env_int(name: str, default: int, *, min_value: int | None = None, max_value
         v = max_value
     return v
 
+def _phx_fetchmany_size(base: int) -> int:
+    """
+    Размер fetchmany для Phoenix: PHX_FETCH_FACTOR > 0 задаёт его кратным CH_INSERT_BATCH
+    (один RPC к PQS приносит сразу k чанков вставки), иначе — base (PHX_FETCHMANY / PHX_FETCHMANY_SIZE).
+    """
+    factor = _env_int("PHX_FETCH_FACTOR", 0, min_value=0)
+    if factor <= 0:
+        return base
+    return _env_int("CH_INSERT_BATCH", 10000, min_value=1) * factor
+
+@_lru_cache(maxsize=32)
+def _csv_tuple(value: str) -> Tuple[str, ...]:
+    """'a, b,,c' → ('a', 'b', 'c'): разбор списка через запятую, один раз на значение."""
+    return tuple(x.strip() for x in value.split(",") if x.strip())
+
 @dataclass(frozen=True)
 class Settings:
     # --- Identity & logging ---
@@ -155,6 +176,8 @@ class Settings:
     JOURNAL_TABLE: str = os.getenv("JOURNAL_TABLE", "public.inc_processing")
     JOURNAL_RETENTION_DAYS: int = _env_int("JOURNAL_RETENTION_DAYS", 30, min_value=1)
     JOURNAL_HEARTBEAT_MIN_INTERVAL_SEC: int = _env_int("JOURNAL_HEARTBEAT_MIN_INTERVAL_SEC", 300, min_value=1)
+    # Обновлять watermark (inc_process_state) раз в N закрытых слайсов; 1 — на каждый слайс, как раньше.
+    JOURNAL_DONE_BATCH: int = _env_int("JOURNAL_DONE_BATCH", 1, min_value=1)
     JOURNAL_AUTOPRUNE_ON_DONE: bool = _as_bool(os.getenv("JOURNAL_AUTOPRUNE_ON_DONE", "1"), True)
 
     # --- Phoenix source ---
@@ -162,7 +185,10 @@ class Settings:
     HBASE_MAIN_TABLE: str = os.getenv("HBASE_MAIN_TABLE", "TBL_JTI_TRACE_CIS_HISTORY")
     HBASE_MAIN_TS_COLUMN: str = os.getenv("HBASE_MAIN_TS_COLUMN", "tm")
     # Единственный источник правды по размеру кадров; совпадает с PhoenixConfig (дефолт 20000).
-    PHX_FETCHMANY_SIZE: int = _env_int("PHX_FETCHMANY", _env_int("PHX_FETCHMANY_SIZE", 20000, min_value=1), min_value=1)
+    # PHX_FETCH_FACTOR > 0 — размер кадра = CH_INSERT_BATCH × factor (см. _phx_fetchmany_size).
+    PHX_FETCHMANY_SIZE: int = _phx_fetchmany_size(
+        _env_int("PHX_FETCHMANY", _env_int("PHX_FETCHMANY_SIZE", 20000, min_value=1), min_value=1)
+    )
     PHX_QUERY_OVERLAP_MINUTES: int = _env_int("PHX_QUERY_OVERLAP_MINUTES", 5, min_value=0)
 
     # --- ClickHouse sink ---
@@ -180,14 +206,62 @@ class Settings:
     CH_CLEAN_ALL_TABLE: str = os.getenv("CH_CLEAN_ALL_TABLE", "stg.daily_codes_history_all")
     CH_DEDUP_BUF_TABLE: str = os.getenv("CH_DEDUP_BUF_TABLE", "stg.daily_codes_history_buf")
     CH_INSERT_BATCH: int = _env_int("CH_INSERT_BATCH", 10000, min_value=1)
+    # Сжатие native-протокола клиент → сервер: zstd | lz4 | lz4hc | 0 (выкл.).
+    CH_COMPRESSION: str = (os.getenv("CH_COMPRESSION", "zstd") or "zstd").strip().lower()
+    # Размер несжатого блока под компрессор native-протокола (байт); у драйвера по умолчанию 1 МиБ.
+    CH_COMPRESS_BLOCK_SIZE: int = _env_int("CH_COMPRESS_BLOCK_SIZE", 4 * 1024 * 1024, min_value=65536)
+    # Чанки меньше порога пишем через async_insert (склейка на сервере), крупные — синхронно; 0 — выкл.
+    # По умолчанию выключено: дедуп async-вставок по insert_deduplication_token зависит от версии/настроек
+    # сервера (async_insert_deduplicate), а повтор чанка после обрыва должен гарантированно отбрасываться.
+    CH_ASYNC_INSERT_BELOW_ROWS: int = _env_int("CH_ASYNC_INSERT_BELOW_ROWS", 0, min_value=0)
+    # 1 — ждать сброса async-буфера (данные видны публикации сразу); 0 — fire-and-forget.
+    CH_ASYNC_INSERT_WAIT: bool = _as_bool(os.getenv("CH_ASYNC_INSERT_WAIT", "1"), True)
+    # Проверка типов драйвером на каждую ячейку INSERT (строки уже нормализованы ETL); 0 — быстрее.
+    # По умолчанию 1, пока новый план вставки (колоночный/presort) не обкатан на проде.
+    CH_INSERT_TYPES_CHECK: bool = _as_bool(os.getenv("CH_INSERT_TYPES_CHECK", "1"), True)
+    # Токен дедупликации на каждый чанк INSERT: ретрай после обрыва не задублирует уже записанный блок.
+    CH_INSERT_DEDUP_TOKEN: bool = _as_bool(os.getenv("CH_INSERT_DEDUP_TOKEN", "1"), True)
+
+    # --- Конвейер Phoenix → CH внутри слайса ---
+    # Глубина очереди готовых чанков между потоком чтения Phoenix и вставкой в CH; 0 — последовательно
+    # (по умолчанию, как и остальные переключатели конкурентности). Включение: например, 4.
+    ETL_PIPELINE_QUEUE: int = _env_int("ETL_PIPELINE_QUEUE", 0, min_value=0)
+    # Предвыборка следующего слайса из Phoenix (отдельное соединение), пока текущий закрывается.
+    PHX_PREFETCH_NEXT_SLICE: bool = _as_bool(os.getenv("PHX_PREFETCH_NEXT_SLICE", "0"))
+    # Колоночная вставка в CH (списки по колонкам, columnar=True) вместо кортежа на строку; 0 — кортежи.
+    CH_INSERT_COLUMNAR: bool = _as_bool(os.getenv("CH_INSERT_COLUMNAR", "1"), True)
+    # Сортировать чанк по ключу таблиц (c, opd, t) перед вставкой: CH не сортирует блок сам,
+    # ценой сортировки в Python. Имеет смысл, когда узкое место — CPU ClickHouse.
+    CH_INSERT_PRESORT: bool = _as_bool(os.getenv("CH_INSERT_PRESORT", "0"))
 
     # --- ETL cadence / gating ---
     # Окно по умолчанию для автозаполнения --until, когда флаг не указан.
     RUN_WINDOW_HOURS: int = _env_int("RUN_WINDOW_HOURS", 24, min_value=1)
     STEP_MIN: int = _env_int("STEP_MIN", 10, min_value=1)
     PUBLISH_EVERY_SLICES: int = _env_int("PUBLISH_EVERY_SLICES", 0, min_value=0)
+    # Размерные пороги промежуточной публикации (срабатывает первый достигнутый; 0 — выключено).
+    PUBLISH_EVERY_ROWS: int = _env_int("PUBLISH_EVERY_ROWS", 0, min_value=0)
+    PUBLISH_EVERY_SEC: int = _env_int("PUBLISH_EVERY_SEC", 0, min_value=0)
+    # Предохранитель: досрочная публикация, когда неопубликованных партиций набралось N (0 — выкл.).
+    PUBLISH_MAX_PENDING_PARTS: int = _env_int("PUBLISH_MAX_PENDING_PARTS", 0, min_value=0)
     PUBLISH_ONLY_IF_NEW: int = int(os.getenv("PUBLISH_ONLY_IF_NEW", "1"))
     PUBLISH_MIN_NEW_ROWS: int = _env_int("PUBLISH_MIN_NEW_ROWS", 1, min_value=0)
+    # Промежуточные публикации — в фоновом потоке (свои CH- и PG-соединения); финальная — всегда синхронно.
+    PUBLISH_IN_BACKGROUND: bool = _as_bool(os.getenv("PUBLISH_IN_BACKGROUND", "0"))
+    # Сколько партиций публиковать одновременно (своё CH-соединение на поток); 1 — последовательно.
+    PUBLISH_PARALLELISM: int = _env_int("PUBLISH_PARALLELISM", 1, min_value=1)
+    # BUF чистится одним TRUNCATE до/после публикации вместо DROP PARTITION на каждую партицию.
+    # Только если BUF не делят процессы с разными advisory-lock (X и manual_X пишут в один CH_DEDUP_BUF_TABLE):
+    # чужой TRUNCATE между INSERT INTO BUF и REPLACE PARTITION опубликует в CLEAN пустой день.
+    CH_PUBLISH_BUF_TRUNCATE: bool = _as_bool(os.getenv("CH_PUBLISH_BUF_TRUNCATE", "0"), False)
+    # Дедуп публикации агрегирует в порядке ключа сортировки (optimize_aggregation_in_order=1).
+    CH_PUBLISH_AGG_IN_ORDER: bool = _as_bool(os.getenv("CH_PUBLISH_AGG_IN_ORDER", "1"), True)
+    # argmax — GROUP BY + argMax(..., ingested_at); limit_by — последняя строка (LIMIT 1 BY c, opd, t);
+    # final — RAW на ReplacingMergeTree(ingested_at), SELECT ... FINAL.
+    CH_PUBLISH_DEDUP_MODE: str = (os.getenv("CH_PUBLISH_DEDUP_MODE", "argmax") or "argmax").strip().lower()
+    # Доп. SETTINGS для INSERT ... SELECT дедупа (JSON-объект); перекрывают настройки режима.
+    # По умолчанию пусто: например, {"max_insert_threads": 4} распараллелит запись в BUF, но и нагрузку на кластер.
+    CH_DEDUP_SETTINGS_JSON: str = (os.getenv("CH_DEDUP_SETTINGS_JSON", "{}") or "").strip()
 
     # --- Columns fallback (при недоступности авто-дискавери через Phoenix) ---
     HBASE_MAIN_COLUMNS: str = os.getenv(
@@ -196,12 +270,23 @@ class Settings:
     )
 
     # -------- Helpers --------
+    # Разбор строки кэшируется (_csv_tuple); наружу — свежий список, как и раньше: вызывающий
+    # может его менять, не задевая кэш.
     def ch_hosts_list(self) -> List[str]:
-        return [h.strip() for h in self.CH_HOSTS.split(",") if h.strip()]
+        return list(_csv_tuple(self.CH_HOSTS))
 
     def main_columns_list(self) -> List[str]:
-        return [c.strip() for c in self.HBASE_MAIN_COLUMNS.split(",") if c.strip()]
+        return list(_csv_tuple(self.HBASE_MAIN_COLUMNS))
     
+@_lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Общий экземпляр Settings на процесс: значения из окружения читаются при импорте модуля,
+    и каждый вызов Settings() лишь копирует их. Клиенты (в т.ч. клоны ClickHouseClient в
+    рабочих потоках) берут один и тот же неизменяемый объект. Для тестов — get_settings.cache_clear().
+    """
+    return Settings()
+
 # -------------------- Phoenix client config (centralized) --------------------
 # Этот блок даёт единый источник правды для настроек клиента Phoenix.
 # Всё читается из переменных окружения (.env) и доступно из кода через
@@ -229,6 +314,7 @@ class PhoenixConfig:
     # Размер кадров для cursor.fetchmany()
     PHX_FETCHMANY: int
 
+@_lru_cache(maxsize=1)
 def get_phoenix_config() -> PhoenixConfig:
     """
     Читает переменные окружения и возвращает иммутабельный конфиг Phoenix.
@@ -237,6 +323,7 @@ def get_phoenix_config() -> PhoenixConfig:
     - Если задана PHX_FETCHMANY — используем её.
     - Иначе, если задана устаревшая PHX_FETCHMANY_SIZE — используем её.
     - В противном случае — дефолт 20000.
+    - PHX_FETCH_FACTOR > 0 перекрывает их: CH_INSERT_BATCH × PHX_FETCH_FACTOR.
     """
     pqs_url = (_os.getenv("PQS_URL", "") or "").strip()
     if not pqs_url:
@@ -248,6 +335,7 @@ def get_phoenix_config() -> PhoenixConfig:
         fetchmany = _env_int("PHX_FETCHMANY_SIZE", 20000, min_value=1)
     else:
         fetchmany = _env_int("PHX_FETCHMANY", 20000, min_value=1)
+    fetchmany = _phx_fetchmany_size(fetchmany)
 
     return PhoenixConfig(
         PQS_URL=pqs_url,
@@ -261,4 +349,4 @@ def get_phoenix_config() -> PhoenixConfig:
         PHX_INITIAL_SLICE_MIN=_env_int("PHX_INITIAL_SLICE_MIN", 5, min_value=0),
         PHX_FETCHMANY=fetchmany,
     )
-__all__ = ["Settings", "PhoenixConfig", "get_phoenix_config"]
\ No newline at end of file
+__all__ = ["Settings", "get_settings", "PhoenixConfig", "get_phoenix_config"]
\ No newline at end of file
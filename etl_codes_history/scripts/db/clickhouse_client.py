@@ -7,9 +7,16 @@ ClickHouse Native-клиент для ETL (только TCP:9000).
 ─────────────
 • Используем официальную библиотеку `clickhouse-driver` (native протокол).
 • Подключение с failover по списку хостов: случайный порядок → первый успешный ответ на `SELECT 1`.
-• Транспортное сжатие включено по умолчанию (ZSTD) — экономит трафик и даёт хороший баланс CPU/скорость.
+• Транспортное сжатие включено по умолчанию (ZSTD, CH_COMPRESSION) — для широких строк (j, ch) трафик
+  заметно меньше, чем с LZ4 драйвера по умолчанию; lz4/lz4hc/off — через тот же параметр.
 • Безопасное выполнение запросов: защита от «залипания» драйвера в insert-режим после больших вставок.
 • INSERT — порциями (чанками). На каждый чанк допускается N повторов (по умолчанию 1) с переподключением.
+• Есть колоночная вставка insert_columns (columnar=True): данные по колонкам, без транспонирования строк.
+• types_check драйвера при INSERT управляется CH_INSERT_TYPES_CHECK (по умолчанию включён); при 0
+  типы считаются уже нормализованными, а повтор чанка после ошибки всё равно идёт с проверкой.
+• На сокете native-соединения включаем TCP_NODELAY (best-effort): без задержки Nagle на мелких
+  пакетах Data/EndOfStream между блоками INSERT. Плюс TCP keepalive (60/20/3 с): простаивающая
+  сессия не обрывается молча. Выставляется на каждый новый сокет, включая переподключения драйвера.
 • Для не-INSERT запросов аккуратно сбрасываем внутренние флаги force_insert* перед исполнением.
 • На редкий флап `UnexpectedPacketFromServerError` делаем reconnect() и повтор (1 раз).
 
@@ -23,7 +30,10 @@ ClickHouse Native-клиент для ETL (только TCP:9000).
 Настройки по умолчанию
 ───────────────────────
 • async_insert / wait_for_async_insert — включены, чтобы не блокировать пайплайн.
+  При CH_ASYNC_INSERT_BELOW_ROWS > 0 режим выбирается по размеру чанка: мелкие — async_insert
+  (сервер склеивает их в крупные блоки), крупные — синхронно (async_insert=0).
 • insert_distributed_sync=1 — безопаснее для распределённых таблиц.
+• insert_block_size = размер чанка (CH_INSERT_BATCH): один чанк — один native-блок.
 • network_compression_method=zstd — оптимальный дефолт.
 • input_format_null_as_default=0 — не подменяем NULL.
 • use_client_time_zone=1 — не пересчитываем TZ на сервере.
@@ -50,7 +60,9 @@ ClickHouse Native-клиент для ETL (только TCP:9000).
 import logging
 import random
 import os
-from typing import Any, Dict, Iterable, List, Optional, Sequence
+import socket
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
 
 from clickhouse_driver import Client as NativeClient  # type: ignore[reportMissingImports]
 from clickhouse_driver import errors as ch_errors  # type: ignore[reportMissingImports]
@@ -199,6 +211,57 @@ def _configure_driver_logging() -> None:
         # Безопасность прежде всего: любые сбои конфигурации логгера — не мешают ходу программы.
         pass
 
+
+def _normalize_compression(value: Any) -> Union[bool, str]:
+    """
+    Значение `compression` для clickhouse-driver: 'zstd' / 'lz4' / 'lz4hc' — явный метод,
+    True/1/on — дефолт драйвера (lz4), False/0/off/none — без сжатия. Неизвестное — 'zstd' с предупреждением.
+    """
+    if isinstance(value, bool):
+        return value
+    v = str(value or "").strip().lower()
+    if v in ("zstd", "lz4", "lz4hc"):
+        return v
+    if v in ("1", "true", "yes", "on"):
+        return True
+    if v in ("", "0", "false", "no", "off", "none"):
+        return False
+    log.warning("Неизвестный CH_COMPRESSION=%r — используем zstd.", value)
+    return "zstd"
+
+
+# TCP keepalive для долгоживущих native-сессий: простой между тяжёлыми запросами (публикация,
+# длинные окна Phoenix) не должен заканчиваться молча закрытым NAT/балансировщиком соединением.
+_TCP_KEEPALIVE_OPTS = tuple(
+    (socket.IPPROTO_TCP, getattr(socket, name), value)
+    for name, value in (("TCP_KEEPIDLE", 60), ("TCP_KEEPINTVL", 20), ("TCP_KEEPCNT", 3))
+    if hasattr(socket, name)
+)
+
+
+def _tune_socket(cli: NativeClient) -> None:
+    """
+    Настраивает сокет подключённого native-клиента (best-effort, один раз на сокет):
+    TCP_NODELAY — мелкие пакеты протокола (Data/EndOfStream) уходят сразу, без задержки Nagle;
+    SO_KEEPALIVE + TCP_KEEPIDLE/INTVL/CNT — мёртвое соединение обнаруживается ядром, а не
+    очередным запросом (UnexpectedPacketFromServer / EOF → reconnect и повтор).
+    Драйвер сам переподключается внутри execute(), поэтому вызывается и перед запросами:
+    уже настроенный сокет узнаётся по ссылке на connection и повторно не трогается.
+    Любая ошибка (нет сокета, иная версия драйвера) игнорируется — failover не страдает.
+    """
+    try:
+        conn = getattr(cli, "connection", None)
+        sock = getattr(conn, "socket", None)
+        if sock is None or getattr(conn, "_etl_tuned_socket", None) is sock:
+            return
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for level, opt, value in _TCP_KEEPALIVE_OPTS:
+            sock.setsockopt(level, opt, value)
+        conn._etl_tuned_socket = sock
+    except Exception:
+        pass
+
 class ClickHouseClient:
     def _probe_single_host(self, host: str, database: str, fqn_names: Sequence[str]) -> Dict[str, bool]:
         """
@@ -223,6 +286,7 @@ class ClickHouseClient:
                 connect_timeout=self.connect_timeout,
                 send_receive_timeout=self.send_receive_timeout,
                 compression=self.compression,
+                compress_block_size=self.compress_block_size,
                 settings=self.settings,
             )
             temp = temp_cli
@@ -271,10 +335,15 @@ class ClickHouseClient:
         password: str = "",
         connect_timeout: int = 5,
         send_receive_timeout: int = 600,
-        compression: bool = True,       # включает сжатие транспорта; нужны lz4/zstd (cityhash обязателен)
+        compression: Union[bool, str, None] = None,  # сжатие транспорта: zstd/lz4/lz4hc/True/False; None — из CH_COMPRESSION
+        compress_block_size: Optional[int] = None,   # размер несжатого блока под компрессор (байт); None — из CH_COMPRESS_BLOCK_SIZE
         settings: Optional[Dict[str, Any]] = None,
         insert_chunk_size: Optional[int] = None,   # размер чанка вставки (строк)
         insert_max_retries: Optional[int] = None,  # повторов на чанк при ошибке соединения
+        async_insert_below_rows: Optional[int] = None,  # чанки меньше порога — через async_insert
+        async_insert_wait: Optional[bool] = None,       # ждать ли подтверждения async-вставки
+        insert_types_check: Optional[bool] = None,      # проверка типов драйвером на каждую ячейку
+        insert_dedup_token: Optional[bool] = None,      # insert_deduplication_token на чанк (идемпотентный ретрай)
         cluster: Optional[str] = None,  # опционально, используется только для вспомогательных проверок
     ):
         self.hosts = [h.strip() for h in (hosts or []) if h and h.strip()]
@@ -286,7 +355,6 @@ class ClickHouseClient:
         self.password = password
         self.connect_timeout = int(connect_timeout)
         self.send_receive_timeout = int(send_receive_timeout)
-        self.compression = bool(compression)
 
         # Необязательное имя кластера, используется только для вспомогательных проверок
         self.cluster = cluster
@@ -308,10 +376,15 @@ class ClickHouseClient:
             self.settings.update(settings)
         # Определяем insert_chunk_size и insert_max_retries (ленивый импорт конфига + запасные дефолты)
         cfg = None
-        if insert_chunk_size is None or insert_max_retries is None:
+        if (
+            insert_chunk_size is None or insert_max_retries is None or async_insert_below_rows is None
+            or async_insert_wait is None or insert_types_check is None or compression is None
+            or insert_dedup_token is None
+            or compress_block_size is None
+        ):
             try:
-                from scripts.config import Settings  # late import чтобы не тянуть конфиг на уровне модуля
-                cfg = Settings()
+                from scripts.config import get_settings  # late import чтобы не тянуть конфиг на уровне модуля
+                cfg = get_settings()
             except Exception:
                 cfg = None
 
@@ -320,8 +393,50 @@ class ClickHouseClient:
         if insert_max_retries is None:
             insert_max_retries = int(getattr(cfg, "CH_INSERT_MAX_RETRIES", 1)) if cfg else 1
 
+        if async_insert_below_rows is None:
+            async_insert_below_rows = int(getattr(cfg, "CH_ASYNC_INSERT_BELOW_ROWS", 0)) if cfg else 0
+        if async_insert_wait is None:
+            async_insert_wait = bool(getattr(cfg, "CH_ASYNC_INSERT_WAIT", True)) if cfg else True
+        if insert_types_check is None:
+            insert_types_check = bool(getattr(cfg, "CH_INSERT_TYPES_CHECK", True)) if cfg else True
+        if insert_dedup_token is None:
+            insert_dedup_token = bool(getattr(cfg, "CH_INSERT_DEDUP_TOKEN", True)) if cfg else True
+        if compression is None:
+            compression = getattr(cfg, "CH_COMPRESSION", "zstd") if cfg else "zstd"
+        # Метод сжатия native-блоков клиент → сервер (clickhouse-driver: True = lz4)
+        self.compression: Union[bool, str] = _normalize_compression(compression)
+        if compress_block_size is None:
+            compress_block_size = int(getattr(cfg, "CH_COMPRESS_BLOCK_SIZE", 4 * 1024 * 1024)) if cfg else 4 * 1024 * 1024
+        # Крупный блок компрессора: чанк INSERT (десятки тысяч строк × ~30 колонок) жмётся меньшим
+        # числом кадров — меньше заголовков и вызовов компрессора (у драйвера по умолчанию 1 МиБ).
+        self.compress_block_size = int(compress_block_size) if int(compress_block_size) > 0 else 1024 * 1024
+
         self.insert_chunk_size = int(insert_chunk_size) if int(insert_chunk_size) > 0 else 20000
         self.insert_max_retries = int(insert_max_retries)
+        # Размер native-блока = размер чанка: драйвер режет INSERT на блоки по insert_block_size,
+        # так каждый чанк уходит одним блоком (один заголовок и один проход компрессора),
+        # а сервер не склеивает/не дробит его повторно. Явное значение из `settings` — в приоритете.
+        self.settings.setdefault("insert_block_size", self.insert_chunk_size)
+        # Мелкие вставки (хвосты слайсов в «тихие» окна) отдаём серверу на склейку через async_insert —
+        # меньше мелких партов и мерджей. Крупные чанки пишем синхронно: так они сразу ложатся
+        # полноценными партами. 0 — порог выключен (действуют общие self.settings).
+        self.async_insert_below_rows = max(0, int(async_insert_below_rows))
+        self._small_insert_settings: Dict[str, Any] = {
+            "async_insert": 1,
+            "wait_for_async_insert": 1 if async_insert_wait else 0,
+            "async_insert_busy_timeout_ms": 1000,
+        }
+        self._bulk_insert_settings: Dict[str, Any] = {
+            "async_insert": 0,
+            "min_insert_block_size_rows": self.insert_chunk_size,
+        }
+        # Строки уже нормализованы ETL (даты/целые/массив), поэтому проверку типов драйвера на каждую
+        # ячейку можно отключить (CH_INSERT_TYPES_CHECK=0); повторная попытка чанка идёт с проверкой —
+        # при несовпадении типов получим понятную ошибку драйвера вместо невнятной упаковки.
+        self.insert_types_check = bool(insert_types_check)
+        # Повтор чанка после обрыва мог догнать уже записанный сервером блок: один и тот же
+        # insert_deduplication_token на все попытки чанка — Replicated*MergeTree отбросит дубль.
+        self.insert_dedup_token = bool(insert_dedup_token)
         self.client: Optional[NativeClient] = None
         self.current_host: Optional[str] = None
         _configure_driver_logging()
@@ -382,13 +497,15 @@ class ClickHouseClient:
         """
         is_insert = self._is_insert(sql)
         exec_settings = settings or {}
+        cli = self._cli()
+        _tune_socket(cli)
         if not is_insert:
             self._clear_force_insert()
 
         # ВАЖНО: если params пустой — вообще не передавать его, чтобы драйвер не переключился на ветку вставки
         if params is None or (isinstance(params, (list, tuple)) and len(params) == 0):
-            return self._cli().execute(sql, settings=exec_settings)
-        return self._cli().execute(sql, params=params, settings=exec_settings)
+            return cli.execute(sql, settings=exec_settings)
+        return cli.execute(sql, params=params, settings=exec_settings)
 
     def _execute_with_retry(
         self,
@@ -499,9 +616,11 @@ class ClickHouseClient:
             connect_timeout=self.connect_timeout,
             send_receive_timeout=self.send_receive_timeout,
             compression=self.compression,
+            compress_block_size=self.compress_block_size,
             settings=self.settings,
         )
         cli.execute(_SQL_PING)
+        _tune_socket(cli)
         self.client = cli
         self.current_host = host
         log.info("Переключился на ClickHouse %s:%d, db=%s", host, self.port, self.db)
@@ -629,9 +748,11 @@ class ClickHouseClient:
                     connect_timeout=self.connect_timeout,
                     send_receive_timeout=self.send_receive_timeout,
                     compression=self.compression,
+                    compress_block_size=self.compress_block_size,
                     settings=self.settings,
                 )
                 cli.execute(_SQL_PING)
+                _tune_socket(cli)
                 self.client = cli
                 self.current_host = host
                 log.info("Подключен к ClickHouse (native) %s:%d, db=%s", host, self.port, self.db)
@@ -647,7 +768,21 @@ class ClickHouseClient:
         """
         Генератор, разбивающий входной iterable `rows` на списки длиной до `insert_chunk_size`.
         Используем списки (а не кортежи), потому что драйверу удобнее подавать списки батчей.
-        """
+        Для list/tuple на входе лишней построчной копии не делаем (см. быстрый путь).
+        """
+        size = self.insert_chunk_size
+        # Быстрый путь: готовый список/кортеж не копируем построчно. Если он уже не больше
+        # чанка — отдаём как есть (без второй копии кортежей в памяти), иначе — срезами.
+        if isinstance(rows, (list, tuple)):
+            n = len(rows)
+            if n <= size:
+                if n:
+                    yield rows  # type: ignore[misc]
+                return
+            for i in range(0, n, size):
+                yield rows[i:i + size]  # type: ignore[misc]
+            return
+
         chunk: List[Any] = []
         for row in rows:
             chunk.append(row)
@@ -693,6 +828,31 @@ class ClickHouseClient:
         """
         return self._execute_with_retry(sql, params=params, settings=settings)  # type: ignore[return-value]
 
+    def clone(self) -> "ClickHouseClient":
+        """
+        Новый независимый клиент с теми же параметрами (хосты, БД, учётка, таймауты, settings).
+        Нужен для работы из другого потока: один NativeClient нельзя делить между потоками.
+        """
+        return ClickHouseClient(
+            hosts=list(self.hosts),
+            port=self.port,
+            database=self.db,
+            user=self.user,
+            password=self.password,
+            connect_timeout=self.connect_timeout,
+            send_receive_timeout=self.send_receive_timeout,
+            compression=self.compression,
+            compress_block_size=self.compress_block_size,
+            settings=dict(self.settings),
+            insert_chunk_size=self.insert_chunk_size,
+            insert_max_retries=self.insert_max_retries,
+            async_insert_below_rows=self.async_insert_below_rows,
+            async_insert_wait=bool(self._small_insert_settings.get("wait_for_async_insert", 1)),
+            insert_types_check=self.insert_types_check,
+            insert_dedup_token=self.insert_dedup_token,
+            cluster=self.cluster,
+        )
+
     def reconnect(self) -> None:
         """
         Принудительно разрывает текущее соединение (если есть) и заново пытается подключиться
@@ -705,6 +865,45 @@ class ClickHouseClient:
             pass
         self._connect_any()
 
+    def _insert_chunk(self, sql: str, table_fqn: str, chunk: Sequence[Any], *, columnar: bool = False) -> int:
+        """
+        Вставка одного чанка с ограниченным числом повторов (между попытками — переподключение).
+        columnar=True — чанк задан по колонкам (список значений на колонку), драйвер не транспонирует строки.
+        Возвращает число вставленных строк; при исчерпании ретраев пробрасывает последнюю ошибку.
+        """
+        n = (len(chunk[0]) if chunk else 0) if columnar else len(chunk)
+        exec_settings: Optional[Dict[str, Any]] = None
+        if self.async_insert_below_rows:
+            exec_settings = (
+                self._small_insert_settings if n < self.async_insert_below_rows
+                else self._bulk_insert_settings
+            )
+        if self.insert_dedup_token:
+            exec_settings = dict(exec_settings or {})
+            exec_settings["insert_deduplication_token"] = uuid.uuid4().hex
+        attempt = 0
+        while True:
+            try:
+                cli = self._cli()
+                _tune_socket(cli)
+                cli.execute(
+                    sql, chunk,
+                    types_check=self.insert_types_check or attempt > 0,
+                    settings=exec_settings,
+                    columnar=columnar,
+                )
+                return n
+            except Exception as e:
+                attempt += 1
+                if attempt > self.insert_max_retries:
+                    # Пробрасываем последнюю ошибку, чтобы вызывающий код увидел фатал
+                    raise
+                log.warning(
+                    "Ошибка вставки в %s (chunk=%d rows): %s — переподключаюсь и повторяю (%d/%d).",
+                    table_fqn, n, e, attempt, self.insert_max_retries
+                )
+                self._connect_any()
+
     def insert_rows(self, table: str, rows: Iterable[Any], columns: Sequence[str]) -> int:
         """
         Вставка данных в таблицу порциями (чанками).
@@ -726,22 +925,30 @@ class ClickHouseClient:
 
         total = 0
         for chunk in self._iter_chunks(rows):
-            attempt = 0
-            while True:
-                try:
-                    self._cli().execute(sql, chunk, types_check=True)
-                    total += len(chunk)
-                    break
-                except Exception as e:
-                    attempt += 1
-                    if attempt > self.insert_max_retries:
-                        # Пробрасываем последнюю ошибку, чтобы вызывающий код увидел фатал
-                        raise
-                    log.warning(
-                        "Ошибка вставки в %s (chunk=%d rows): %s — переподключаюсь и повторяю (%d/%d).",
-                        table_fqn, len(chunk), e, attempt, self.insert_max_retries
-                    )
-                    self._connect_any()
+            total += self._insert_chunk(sql, table_fqn, chunk)
+        return total
+
+    def insert_columns(self, table: str, columns: Sequence[str], data: Sequence[Sequence[Any]]) -> int:
+        """
+        Колоночная вставка (SoA): `data` — по одному списку значений на колонку, в порядке `columns`.
+        Native-протокол ClickHouse колоночный, поэтому драйвер пишет такие данные без построчного
+        транспонирования (columnar=True), а вызывающему не нужны кортежи на каждую строку.
+        Большие блоки режутся срезами колонок по `insert_chunk_size`.
+
+        Возвращает количество вставленных строк.
+        """
+        if not data:
+            return 0
+        table_fqn = table if "." in table else f"{self.db}.{table}"
+        sql = f"INSERT INTO {table_fqn} ({', '.join(columns)}) VALUES"
+
+        n = len(data[0])
+        size = self.insert_chunk_size
+        if n <= size:
+            return self._insert_chunk(sql, table_fqn, data, columnar=True) if n else 0
+        total = 0
+        for i in range(0, n, size):
+            total += self._insert_chunk(sql, table_fqn, [col[i:i + size] for col in data], columnar=True)
         return total
 
 # Совместимость
@@ -31,7 +31,8 @@ from __future__ import annotations
 import logging
 import os
 import socket
-from typing import Any, Iterable, Optional, Tuple
+from contextlib import contextmanager, nullcontext
+from typing import Any, Iterable, Iterator, Optional, Tuple
 
 import psycopg  # type: ignore
 from psycopg import OperationalError  # type: ignore
@@ -111,6 +112,8 @@ class PGClient:
         # Атрибуты по умолчанию (важно для корректной работы статического анализатора)
         self.conn = None
         self.cur = None
+        self._dsn = dsn
+        self._autocommit = autocommit
 
         host, port, dbname = _dsn_info(dsn)
 
@@ -171,6 +174,33 @@ class PGClient:
             raise RuntimeError("Курсор PostgreSQL закрыт — соединение уже завершено")
         c.execute(sql, params or ())
 
+    @contextmanager
+    def pipeline(self) -> Iterator[None]:
+        """
+        Pipeline-режим psycopg3: команды внутри блока уходят на сервер без ожидания ответа на каждую,
+        синхронизация — на первом fetch*() или при выходе из блока (один round-trip на пачку).
+        Если драйвер/libpq pipeline не поддерживают — обычное последовательное исполнение.
+        """
+        conn = self.conn
+        make = getattr(conn, "pipeline", None) if conn is not None else None
+        ctx = nullcontext()
+        if callable(make):
+            try:
+                if psycopg.Pipeline.is_supported():
+                    ctx = make()
+            except Exception:
+                ctx = nullcontext()
+        with ctx:
+            yield
+
+    def clone(self) -> "PGClient":
+        """
+        Новое независимое соединение с тем же DSN/autocommit.
+        Нужен для работы из другого потока: у обёртки один курсор, и делить его между потоками нельзя
+        (команды перемешаются, fetch* вернёт чужой результат).
+        """
+        return PGClient(self._dsn, autocommit=self._autocommit)
+
     def fetchone(self) -> Optional[Tuple[Any, ...]]:
         c = self.cur
         if c is None:
@@ -10,6 +10,7 @@
 
 Что важно для перформанса:
 • Генерируем batches (list[dict]) без лишних преобразований; маппинг колонок — через zip(names, row).
+  При PHX_POSITIONAL_ROWS=1 — RowBatch: строки драйвера как есть + имена колонок (без dict на строку).
 • Используем cursor.arraysize = fetchmany_size (если драйвер позволяет).
 • Поддерживаем «начальный» размер среза (PHX_INITIAL_SLICE_MIN, по умолчанию 5 минут) с выравниванием по UTC-сетке.
   Если PHX_INITIAL_SLICE_MIN=0 — адаптивная нарезка отключена, окно читается одним куском.
@@ -25,12 +26,16 @@ import logging
 import os
 import random
 import socket
+import sys
+import threading
 import time
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 from dataclasses import dataclass
 from urllib.parse import urlparse
 
+from .prefetch import PrefetchIterator
+
 try:
     import phoenixdb  # type: ignore[import-untyped]
 except Exception:  # pragma: no cover - для среды разработки без установленного драйвера
@@ -68,6 +73,16 @@ def _render_columns(columns) -> str:
         return "*"
     return ", ".join(_quote_ident(c) for c in columns)
 
+def _render_hint(hint: Optional[str]) -> str:
+    """
+    Хинт Phoenix для SELECT: '' → без хинта, иначе '/*+ HINT */ '.
+    Границы сканирования (start/stop row) Phoenix строит сам из WHERE по PK/индексу, поэтому
+    для таблиц, где время не в префиксе ключа, окно сужают хинтом на индекс по ts-колонке.
+    """
+    h = (hint or "").strip().replace("*/", "")
+    return f"/*+ {h} */ " if h else ""
+
+
 def _env_int(name: str, default: int) -> int:
     """Безопасное чтение целого из ENV (пустые/невалидные → default)."""
     v = os.getenv(name)
@@ -79,6 +94,18 @@ def _env_int(name: str, default: int) -> int:
         return default
 
 
+class RowBatch(list):
+    """
+    Позиционный батч Phoenix: список строк (кортежи/списки в порядке SELECT) + имена колонок `names`.
+    Без dict на строку: потребитель (slices) берёт значения по индексу, а колонки — транспонированием.
+    """
+    __slots__ = ("names",)
+
+    def __init__(self, rows: Sequence[Any], names: Tuple[str, ...]) -> None:
+        super().__init__(rows)
+        self.names = names
+
+
 def _is_overload_error(exc: BaseException) -> bool:
     """Эвристика перегрузки Phoenix JobManager/очереди (распознаём типовые сообщения)."""
     try:
@@ -133,6 +160,7 @@ class _AdaptiveParams:
     max_attempts: int    # PHX_OVERLOAD_MAX_ATTEMPTS
     min_split_min: int   # PHX_OVERLOAD_MIN_SPLIT_MIN
     max_depth: int       # PHX_OVERLOAD_MAX_DEPTH
+    scan_parallelism: int  # PHX_SCAN_PARALLELISM
 
 def _load_adaptive_params_from_env() -> _AdaptiveParams:
     """Читает ENV и возвращает параметры адаптивной вытяжки с безопасными дефолтами.
@@ -143,9 +171,17 @@ def _load_adaptive_params_from_env() -> _AdaptiveParams:
         max_attempts=_env_int("PHX_OVERLOAD_MAX_ATTEMPTS", 4),
         min_split_min=_env_int("PHX_OVERLOAD_MIN_SPLIT_MIN", 2),
         max_depth=_env_int("PHX_OVERLOAD_MAX_DEPTH", 3),
+        scan_parallelism=max(1, _env_int("PHX_SCAN_PARALLELISM", 1)),
     )
 
 
+def _split_window(f: datetime, t: datetime, parts: int) -> List[Tuple[datetime, datetime]]:
+    """Делит [f; t) на parts равных по времени под-окон (для параллельного чтения цельного окна)."""
+    step = (t - f) / parts
+    bounds = [f + step * i for i in range(parts)] + [t]
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+
 # ------------------------ основной клиент ------------------------
 
 class PhoenixClient:
@@ -171,7 +207,14 @@ class PhoenixClient:
         # - PHX_OVERLOAD_MAX_ATTEMPTS — число повторов при перегрузке очереди JobManager
         # - PHX_OVERLOAD_MIN_SPLIT_MIN — нижняя граница размера под-окна (минуты) при рекурсивном сплите
         # - PHX_OVERLOAD_MAX_DEPTH — максимальная глубина рекурсивного сплита
+        # - PHX_SCAN_PARALLELISM — число параллельных под-запросов окна (свои соединения; 1 — выкл.)
         self._tcp_probe_timeout_ms = _env_int("PHX_TCP_PROBE_TIMEOUT_MS", 0)
+        # - PHX_SCANNER_CACHING — строк на один RPC сканера HBase (свойство соединения); 0 — дефолт кластера
+        self._scanner_caching = _env_int("PHX_SCANNER_CACHING", 0)
+        # - PHX_QUERY_HINT — хинт Phoenix для оконного SELECT (напр. RANGE_SCAN или INDEX(tbl idx_opd))
+        self._query_hint = _render_hint(os.getenv("PHX_QUERY_HINT", ""))
+        # - PHX_POSITIONAL_ROWS — батчи RowBatch (строки как есть + имена колонок) вместо list[dict]
+        self._positional_rows = _env_int("PHX_POSITIONAL_ROWS", 0) > 0
 
         # Кэш проекций (имена колонок) — снижает накладные расходы на `description`
         self._last_projection_key: Optional[Tuple[str, ...]] = None
@@ -188,6 +231,13 @@ class PhoenixClient:
         finally:
             self._conn = None
 
+    def clone(self) -> "PhoenixClient":
+        """
+        Новый независимый клиент с тем же URL и fetchmany_size (своё ленивое соединение).
+        Нужен для чтения из другого потока: соединение phoenixdb нельзя делить между потоками.
+        """
+        return PhoenixClient(self._url, fetchmany_size=self._fetchmany_size)
+
     def _tcp_probe(self) -> None:
         """Опциональная быстрая TCP-проверка доступности Avatica (до HTTP запроса).
         Управляется PHX_TCP_PROBE_TIMEOUT_MS (мс). 0/пусто — отключено.
@@ -213,7 +263,11 @@ class PhoenixClient:
             raise RuntimeError("Драйвер 'phoenixdb' не установлен в окружении.")
         self._tcp_probe()  # быстрый фэйл раньше HTTP, если включено
         # autocommit=True — мы только читаем; это снижает накладные расходы
-        self._conn = phoenixdb.connect(self._url, autocommit=True, serialization="protobuf")  # type: ignore[call-arg]
+        props: Dict[str, Any] = {}
+        if self._scanner_caching > 0:
+            # Больше строк на RPC к RegionServer — меньше round-trip'ов на длинных сканах
+            props["hbase.client.scanner.caching"] = str(self._scanner_caching)
+        self._conn = phoenixdb.connect(self._url, autocommit=True, serialization="protobuf", **props)  # type: ignore[call-arg]
         return self._conn
 
     # ------------------------ вспомогательное ------------------------
@@ -248,7 +302,7 @@ class PhoenixClient:
     ) -> Iterator[List[Dict[str, Any]]]:
         """
         Чтение данных из Phoenix за окно [from_dt; to_dt) одним запросом.
-        Возвращает генератор батчей (list[dict]).
+        Возвращает генератор батчей (list[dict]; при PHX_POSITIONAL_ROWS=1 — RowBatch).
         """
         if not columns:
             raise ValueError("columns пуст")
@@ -265,7 +319,7 @@ class PhoenixClient:
         ts_sql = _quote_ident(ts_col)
 
         sql = (
-            f"SELECT {cols_sql} "
+            f"SELECT {self._query_hint}{cols_sql} "
             f"FROM {table} "
             f"WHERE {ts_sql} >= ? AND {ts_sql} < ? "
             f"ORDER BY {ts_sql} ASC"
@@ -276,6 +330,9 @@ class PhoenixClient:
             try:
                 # Если драйвер поддерживает — уменьшаем число round-trip'ов
                 cur.arraysize = int(self._fetchmany_size)
+                # Размер фрейма Avatica (строк на один HTTP-ответ PQS): по умолчанию 2000,
+                # поднимаем до fetchmany_size, чтобы один fetchmany не дробился на несколько RPC
+                cur.itersize = int(self._fetchmany_size)
             except Exception:
                 pass
 
@@ -287,11 +344,21 @@ class PhoenixClient:
                 names = self._last_projection_names
             else:
                 desc = getattr(cur, "description", None)
-                names = tuple(d[0] for d in desc) if desc else key
+                # Интернируем имена: ключи dict-строк совпадут по ссылке с литералами CH_COLUMNS,
+                # и каждый row.get(col) в конвертере обойдётся без сравнения строк по содержимому
+                names = tuple(sys.intern(str(d[0])) for d in desc) if desc else key
                 self._last_projection_key = key
                 self._last_projection_names = names
 
             fetch_sz = int(self._fetchmany_size)
+            if self._positional_rows:
+                # Позиционный режим: имена — ровно запрошенные columns (порядок SELECT), строки — как есть
+                while True:
+                    rows = cur.fetchmany(fetch_sz)
+                    if not rows:
+                        break
+                    yield RowBatch(rows, key)
+                return
             while True:
                 rows = cur.fetchmany(fetch_sz)
                 if not rows:
@@ -313,7 +380,7 @@ class PhoenixClient:
         """Отдельное логирование сплита окна — выделено для снижения когнитивной сложности."""
         log.warning(
             "Phoenix перегружен на окне %s → %s (≈%d мин). Делю окно (глубина %d/%d)...",
-            s0.isoformat(), e0.isoformat(), span_min, depth, max_depth,
+            s0, e0, span_min, depth, max_depth,
         )
 
     def _log_overload_retry(self, next_attempt: int, max_attempts: int, backoff: float) -> None:
@@ -419,6 +486,16 @@ class PhoenixClient:
         f = self._as_naive_utc(from_dt)
         t = self._as_naive_utc(to_dt)
 
+        if params.scan_parallelism > 1:
+            windows = (
+                _split_window(f, t, params.scan_parallelism)
+                if params.init_min <= 0
+                else list(_iter_utc_grid(f, t, params.init_min))
+            )
+            if len(windows) > 1:
+                yield from self._fetch_windows_parallel(table, ts_col, columns, windows, params)
+                return
+
         # Единый цикл поверх «одного окна» или «сеточных» срезов.
         for s, e in self._iter_slices_or_whole(f, t, params.init_min):
             yield from self._pull_with_retries(
@@ -427,4 +504,47 @@ class PhoenixClient:
                 max_depth=params.max_depth,
                 max_attempts=params.max_attempts,
                 depth=0,
-            )
\ No newline at end of file
+            )
+
+    def _fetch_windows_parallel(
+        self,
+        table: str,
+        ts_col: str,
+        columns: Sequence[str],
+        windows: List[Tuple[datetime, datetime]],
+        params: _AdaptiveParams,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Параллельное чтение под-окон: до PHX_SCAN_PARALLELISM потоков, у каждого своё соединение
+        (clone), под-окна разбираются из общей очереди, батчи сливаются в одну ограниченную очередь.
+        Порядок батчей между под-окнами не сохраняется (для INSERT в RAW он не важен);
+        перегрузка обрабатывается как обычно — в _pull_with_retries каждого под-окна.
+        """
+        workers = min(params.scan_parallelism, len(windows))
+        pending = iter(windows)
+        lock = threading.Lock()
+        clients = [self.clone() for _ in range(workers)]
+
+        def _worker(cli: "PhoenixClient") -> Iterator[List[Dict[str, Any]]]:
+            while True:
+                with lock:
+                    w = next(pending, None)
+                if w is None:
+                    return
+                yield from cli._pull_with_retries(
+                    table, ts_col, columns, w[0], w[1],
+                    min_split_min=params.min_split_min,
+                    max_depth=params.max_depth,
+                    max_attempts=params.max_attempts,
+                    depth=0,
+                )
+
+        # Общий helper ограниченной очереди: поток на воркера, ошибка любого — потребителю,
+        # остальные останавливаются на ближайшем put()
+        it = PrefetchIterator([_worker(cli) for cli in clients], workers * 2, "phx-scan")
+        try:
+            yield from it
+        finally:
+            it.close()
+            for cli in clients:
+                cli.close()
@@ -0,0 +1,106 @@
+# file: scripts/db/prefetch.py
+# -*- coding: utf-8 -*-
+"""
+Единый helper фонового чтения через ограниченную очередь (producer/consumer).
+
+Используется везде, где сетевой I/O перекрывается с работой потребителя:
+- конвейер слайса (чтение Phoenix → конвертация → вставка в CH, см. slices.process_one_slice);
+- предвыборка следующего слайса (slices.SlicePrefetcher);
+- параллельное чтение под-окон Phoenix (PhoenixClient._fetch_windows_parallel).
+
+Гарантии:
+- очередь ограничена queue_size — вперёд читается не больше queue_size элементов, память не растёт;
+- у каждого источника свой поток; элементы разных источников сливаются в одну очередь
+  (порядок сохраняется только внутри источника);
+- ошибка любого источника пробрасывается потребителю из next(), остальные источники останавливаются;
+- close() (или выход из with) останавливает производителей на ближайшем put() и закрывает
+  источники (close() у генераторов — например, курсор Phoenix), даже если итерация не начиналась.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+from typing import Any, Iterable, Iterator, List, Optional, Sequence
+
+__all__ = ["PrefetchIterator"]
+
+_END = object()  # маркер «источник исчерпан» в очереди
+
+
+class PrefetchIterator(Iterator[Any]):
+    """Итератор по элементам sources, которые читаются фоновыми потоками (запуск — сразу в __init__)."""
+
+    def __init__(self, sources: Sequence[Iterable[Any]], queue_size: int, name: str = "prefetch") -> None:
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        self._done = 0
+        self._finished = False
+        single = len(sources) == 1
+        self._threads = [
+            threading.Thread(
+                target=self._produce, args=(src,), name=name if single else f"{name}-{i}", daemon=True,
+            )
+            for i, src in enumerate(sources)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _put(self, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, source: Iterable[Any]) -> None:
+        it: Optional[Iterator[Any]] = None
+        try:
+            it = iter(source)
+            for item in it:
+                if not self._put(item):
+                    return
+        except BaseException as ex:  # noqa: BLE001 — пробрасываем потребителю
+            self._errors.append(ex)
+        finally:
+            close = getattr(it, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+            self._put(_END)
+
+    def __iter__(self) -> "PrefetchIterator":
+        return self
+
+    def __next__(self) -> Any:
+        if not self._finished:
+            # Каждый производитель всегда кладёт _END (stop выставляет только close()),
+            # поэтому блокирующий get() не зависает.
+            while self._done < len(self._threads) and not self._errors:
+                item = self._q.get()
+                if item is _END:
+                    self._done += 1
+                    continue
+                return item
+            self.close()
+            if self._errors:
+                raise self._errors[0]
+        raise StopIteration
+
+    def close(self) -> None:
+        """Останавливает производителей и дожидается их потоков (идемпотентно)."""
+        self._finished = True
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+
+    def __enter__(self) -> "PrefetchIterator":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
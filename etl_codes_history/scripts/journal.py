@@ -5,7 +5,7 @@ import json
 import logging
 from typing import Any, Dict, Optional, List, Tuple, Protocol, runtime_checkable, Callable, cast
 from datetime import datetime, timezone, timedelta, tzinfo
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 import os
 import time
 import re
@@ -237,24 +237,37 @@ class ProcessJournal:
     ENV:
       - JOURNAL_PARTITION_INTERVAL_DAYS=7|14|30 (def: 7) — длина окна партиции
       - JOURNAL_PARTITION_BEHIND=1, JOURNAL_PARTITION_AHEAD=1 — количество окон назад/вперёд
+      - JOURNAL_UNLOGGED=0|1 (def: 0) — новые партиции журнала создаются UNLOGGED (без WAL).
+        После аварийного рестарта PG они будут пустыми: активные planned/running пропадут,
+        но watermark в inc_process_state сохранится, и следующий запуск продолжит с него.
+        Существующие партиции переводятся миграцией ddl/pg_journal_unlogged.sql.
       - JOURNAL_LOG_TZ='Asia/Almaty' — TZ только для логов
     """
 
-    # ---------- PG commit helper ----------
+    # ---------- PG commit/pipeline helpers ----------
 
-    def _commit_quietly(self) -> None:
+    def _pipeline(self):
+        """pg.pipeline() (psycopg3: пачка команд — один round-trip), если обёртка его умеет; иначе пустой контекст."""
+        make = getattr(self.pg, "pipeline", None)
+        return make() if callable(make) else nullcontext()
+
+    def _commit(self) -> None:
         """
-        Best-effort commit для разных PG-обёрток.
-        Если .commit() нет — предполагаем autocommit. Исключения гасим.
+        Commit для разных PG-обёрток; ошибку пробрасывает (нужно там, где от успеха commit
+        зависит состояние в памяти, например кэш watermark). Если .commit() нет — предполагаем autocommit.
         """
+        commit_fn = getattr(self.pg, "commit", None)
+        if callable(commit_fn):
+            commit_fn()
+            return
+        conn = getattr(self.pg, "conn", None) or getattr(self.pg, "connection", None)
+        if conn and hasattr(conn, "commit"):
+            conn.commit()
+
+    def _commit_quietly(self) -> None:
+        """Best-effort вариант _commit(): исключения гасим."""
         try:
-            commit_fn = getattr(self.pg, "commit", None)
-            if callable(commit_fn):
-                commit_fn()
-                return
-            conn = getattr(self.pg, "conn", None) or getattr(self.pg, "connection", None)
-            if conn and hasattr(conn, "commit"):
-                conn.commit()
+            self._commit()
         except Exception:
             pass
 
@@ -299,6 +312,12 @@ class ProcessJournal:
         except Exception:
             self.hb_min_interval = 300
         self._last_hb_mono: float = 0.0
+        # Кэш watermark (last_ok_end): строку состояния процесса пишем только мы (под advisory-lock),
+        # поэтому значение после UPSERT/первого чтения можно отдавать без round-trip в PG.
+        self._last_ok_end_cache: Optional[datetime] = None
+        # UNLOGGED-партиции журнала: planned/running/ok — эфемерная история, WAL на неё не тратим.
+        # Таблица состояния (watermark) остаётся журналируемой — она переживает crash PG.
+        self.unlogged: bool = os.getenv("JOURNAL_UNLOGGED", "0").strip().lower() in ("1", "true", "yes", "on")
         self._self_check_pg_client()
 
         # Кэш разбора имён и relkind для снижения накладных расходов на повторные SELECT и split()
@@ -528,9 +547,12 @@ class ProcessJournal:
             schema, parent = self._schema, self._parent_name
             now_utc = datetime.now(timezone.utc)
             cur_start = self._floor_to_interval_utc(now_utc, interval_days)
+            unlogged = "UNLOGGED " if self.unlogged else ""
 
             def part_name(st: datetime, en: datetime) -> str:
-                return f"{parent}_p_{st.strftime('%Y%m%d')}_{en.strftime('%Y%m%d')}"
+                # YYYYMMDD целочисленно — без strftime на каждую партицию
+                return (f"{parent}_p_{st.year * 10000 + st.month * 100 + st.day}"
+                        f"_{en.year * 10000 + en.month * 100 + en.day}")
 
             def _fmt(dt: datetime) -> str:
                 return self._fmt_ts(dt)
@@ -550,9 +572,9 @@ class ProcessJournal:
                     child = part_name(st, en)
                     st_s = _fmt(st)
                     en_s = _fmt(en)
-                    # 1) партиция
+                    # 1) партиция (UNLOGGED при JOURNAL_UNLOGGED=1 — без WAL на горячих UPDATE журнала)
                     _exec(
-                        f"CREATE TABLE IF NOT EXISTS {schema}.{child} PARTITION OF {self.table} "
+                        f"CREATE {unlogged}TABLE IF NOT EXISTS {schema}.{child} PARTITION OF {self.table} "
                         f"FOR VALUES FROM ('{st_s}') TO ('{en_s}')"
                     )
                     # 2) индексы: активная уникальность + быстрый выбор завершённых
@@ -735,7 +757,10 @@ class ProcessJournal:
         Возвращает watermark — последнюю успешно обработанную правую границу окна (last_ok_end)
         из таблицы состояния процесса (self.state_table). Всегда приводит время к UTC (aware).
         Если записи нет или поле пустое — возвращает None.
+        Значение кэшируется (write-through из _state_upsert): повторные вызовы не ходят в PG.
         """
+        if self._last_ok_end_cache is not None:
+            return self._last_ok_end_cache
         try:
             # Читаем last_ok_end для текущего процесса
             self.pg.execute(
@@ -767,6 +792,7 @@ class ProcessJournal:
             else:
                 dt = dt.astimezone(timezone.utc)
 
+            self._last_ok_end_cache = dt
             return dt
         except Exception:
             # Безопасная деградация: при ошибке возвращаем None; основная логика корректно обработает это.
@@ -785,9 +811,12 @@ class ProcessJournal:
         last_error_message: Optional[str] = None,
         progress: Optional[Dict[str, Any]] = None,
         extra: Optional[Dict[str, Any]] = None,
+        commit: bool = True,
     ) -> None:
         """
         Надёжный UPSERT агрегированного состояния процесса в inc_process_state.
+        commit=False — без commit (вызывающий фиксирует сам, например после pipeline-пакета)
+        и без обновления кэша watermark: его выставляет вызывающий после успешного sync/commit.
 
         Уменьшаем когнитивную сложность (Sonar S3776):
           • вместо множества if-блоков собираем данные через словари и comprehensions;
@@ -914,7 +943,11 @@ class ProcessJournal:
         )
 
         self.pg.execute(sql, params)
-        self._commit_quietly()
+        if commit:
+            # Кэш watermark — только после успешного commit: иначе он убежит вперёд значения в БД
+            self._commit()
+            if last_ok_end is not None:
+                self._last_ok_end_cache = self._to_aware_utc(last_ok_end)
 
     def get_state(self) -> Dict[str, Any]:
         """Возвращает текущую строку из inc_process_state по процессу (или пустой dict)."""
@@ -947,6 +980,14 @@ class ProcessJournal:
     # ---------- эксклюзивные блокировки ----------
 
     def try_acquire_exclusive_lock(self) -> bool:
+        """
+        Эксклюзив процесса — session-level advisory-lock (shared memory, без MVCC и row-lock'ов).
+        Все переходы planned/running/ok/error под ним — обычные UPDATE без SELECT ... FOR UPDATE:
+        конкурентов за те же строки нет, пока lock у нас. Повторный вызов в той же сессии
+        не ходит в PG и не «стекает» lock (иначе понадобилось бы столько же unlock).
+        """
+        if self._lock_acquired:
+            return True
         self.pg.execute(_SQL_TRY_LOCK, (self.process_name,))
         _row_lock = self.pg.fetchone()
         got = bool(_row_lock[0]) if _row_lock else False  # fetchone() может вернуть None
@@ -960,11 +1001,13 @@ class ProcessJournal:
 
     @contextmanager
     def exclusive_lock(self):
+        # Вложенный exclusive_lock() (lock уже наш) — не отпускаем его на выходе из внутреннего блока
+        owned_before = self._lock_acquired
         got = self.try_acquire_exclusive_lock()
         try:
             yield got
         finally:
-            if got:
+            if got and not owned_before:
                 self.release_exclusive_lock()
 
     # ---------- API журнала ----------
@@ -1188,9 +1231,13 @@ class ProcessJournal:
         rows_read: int | None = None,
         rows_written: int | None = None,
         extra: Optional[Dict[str, Any]] = None,
+        *,
+        update_state: bool = True,
     ) -> Optional[int]:
         """
         Закрыть запуск со статусом OK для окна [slice_from, slice_to).
+        update_state=False — закрыть только строку журнала, без UPSERT watermark'а и ретенции
+        (их сделает mark_state_ok(), см. DoneBuffer).
 
         Минимизируем когнитивную сложность:
           • вся ветвистая логика закрытия вынесена в _close_ok();
@@ -1202,17 +1249,31 @@ class ProcessJournal:
         sf, st = self._slice_iso_texts(slice_from, slice_to)
         metrics = self._build_done_metrics(rows_read, rows_written, extra)
 
-        # 1) Попытаться закрыть запись (точное окно → иначе последняя активная)
-        rid = self._close_ok(sf, st, metrics)
+        with self._pipeline():
+            # 1) Попытаться закрыть запись (точное окно → иначе последняя активная)
+            rid = self._close_ok(sf, st, metrics)
 
-        # 2) Фиксируем изменения одним best‑effort коммитом
-        self._commit_quietly()
+            # 2) Фиксируем изменения одним best‑effort коммитом (в pipeline — без отдельного round-trip)
+            self._commit_quietly()
 
         # 3) Агрегированное состояние и возможная ретенция партиций — best‑effort (без влияния на горячий путь)
-        self._best_effort_state_ok_and_prune(slice_to, metrics)
+        if update_state:
+            self._best_effort_state_ok_and_prune(slice_to, metrics)
 
         return rid
 
+    def mark_state_ok(
+        self,
+        slice_to: datetime,
+        rows_read: int | None = None,
+        rows_written: int | None = None,
+    ) -> None:
+        """
+        Только агрегированное состояние после уже закрытых слайсов: watermark (last_ok_end = slice_to),
+        прогресс и ретенция — best‑effort, как в mark_done().
+        """
+        self._best_effort_state_ok_and_prune(slice_to, self._build_done_metrics(rows_read, rows_written, None))
+
     def _close_ok(self, sf: str, st: str, metrics: Dict[str, Any]) -> Optional[int]:
         """
         Закрывает running-запись статусом OK.
@@ -1239,14 +1300,21 @@ class ProcessJournal:
           • аккуратно обновляем inc_process_state (last_ok_end, прогресс);
           • опционально триггерим авто‑ретенцию партиций (раз в сутки).
         Все ошибки гасим — это не должно валить основной ETL-поток.
+        UPSERT и commit уходят одним pipeline-пакетом; commit явный (_commit, без гашения),
+        и кэш watermark обновляем, только если ни UPSERT, ни commit не упали.
         """
+        last_ok_end = self._to_aware_utc(slice_to)
         try:
-            self._state_upsert(
-                status="ok",
-                healthy=True,
-                last_ok_end=self._to_aware_utc(slice_to),
-                progress={k: v for k, v in metrics.items() if k in ("rows_read", "rows_written")},
-            )
+            with self._pipeline():
+                self._state_upsert(
+                    status="ok",
+                    healthy=True,
+                    last_ok_end=last_ok_end,
+                    progress={k: v for k, v in metrics.items() if k in ("rows_read", "rows_written")},
+                    commit=False,
+                )
+                self._commit()
+            self._last_ok_end_cache = last_ok_end
         except Exception:
             pass
 
@@ -1523,4 +1591,36 @@ class ProcessJournal:
             # Любые сбои в фоновом обслуживании не должны влиять на основной путь ETL.
             log.debug("auto_prune_if_due(): skipped due to error", exc_info=True)
 
-            
\ No newline at end of file
+            
+
+class DoneBuffer:
+    """
+    Пакетное закрытие слайсов (JOURNAL_DONE_BATCH): строку журнала каждого слайса закрываем
+    сразу (mark_done без состояния) — частичный UNIQUE индекс допускает лишь одну активную запись,
+    и следующий mark_planned/mark_running иначе упрётся в неё. Пачкой раз в size слайсов идёт
+    только UPSERT watermark'а в inc_process_state и ретенция.
+    Цена — watermark (last_ok_end) отстаёт максимум на size-1 слайсов; при падении повторно
+    обработаются только они (RAW → дедуп на публикации, повтор безопасен).
+    """
+
+    __slots__ = ("_journal", "_size", "_pending", "_last")
+
+    def __init__(self, journal: ProcessJournal, size: int) -> None:
+        self._journal = journal
+        self._size = max(1, int(size))
+        self._pending = 0
+        self._last: Optional[Tuple[datetime, Optional[int], Optional[int]]] = None
+
+    def __call__(self, s: datetime, e: datetime, *, rows_read: int, rows_written: int) -> Optional[int]:
+        rid = self._journal.mark_done(s, e, rows_read=rows_read, rows_written=rows_written, update_state=False)
+        if self._last is None or e >= self._last[0]:
+            self._last = (e, rows_read, rows_written)
+        self._pending += 1
+        if self._pending >= self._size:
+            self.flush()
+        return rid
+
+    def flush(self) -> None:
+        last, self._last, self._pending = self._last, None, 0
+        if last is not None:
+            self._journal.mark_state_ok(*last)
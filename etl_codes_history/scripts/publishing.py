@@ -15,14 +15,20 @@
 
 from __future__ import annotations
 
+import json
 import logging
 import os
+import re
 import socket
-from datetime import datetime, timedelta, timezone
+import threading
+from datetime import date, datetime, timedelta, timezone
 from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, TYPE_CHECKING, cast
 
 log = logging.getLogger("codes_history_increment")
 
+# Имя настройки ClickHouse подставляется в SQL как есть — допускаем только идентификатор
+_SETTING_NAME_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
 # --- Журнал запусков (best effort на этапе публикации) ---
 from .journal import ProcessJournal
 from .config import Settings
@@ -65,6 +71,13 @@ else:
 
 # ------------------------------- Вспомогательные хелперы -------------------------------
 
+def _part_to_date(p: int) -> date:
+    """YYYYMMDD → date целочисленным divmod (без strptime/строковых преобразований)."""
+    y, rem = divmod(int(p), 10000)
+    m, d = divmod(rem, 100)
+    return date(y, m, d)
+
+
 def _parts_to_interval(parts: Iterable[int]) -> Tuple[datetime, datetime]:
     """
     По набору YYYYMMDD → (UTC-начало, UTC-конец последнего дня).
@@ -74,11 +87,10 @@ def _parts_to_interval(parts: Iterable[int]) -> Tuple[datetime, datetime]:
     if not ps:
         now = datetime.now(timezone.utc)
         return now, now
-    p0, p1 = ps[0], ps[-1]
-    y0, m0, d0 = p0 // 10000, (p0 // 100) % 100, p0 % 100
-    y1, m1, d1 = p1 // 10000, (p1 // 100) % 100, p1 % 100
-    start = datetime(y0, m0, d0, tzinfo=timezone.utc)
-    end   = datetime(y1, m1, d1, tzinfo=timezone.utc) + timedelta(days=1)
+    d0 = _part_to_date(ps[0])
+    d1 = date.fromordinal(_part_to_date(ps[-1]).toordinal() + 1)
+    start = datetime(d0.year, d0.month, d0.day, tzinfo=timezone.utc)
+    end   = datetime(d1.year, d1.month, d1.day, tzinfo=timezone.utc)
     return start, end
 
 
@@ -135,8 +147,185 @@ def select_parts_to_publish(
     return {p for p in pending_parts if new_rows_by_part.get(p, 0) >= publish_min_new_rows}
 
 
+def _dedup_extra_settings(cfg: Settings) -> Dict[str, Any]:
+    """
+    Дополнительные SETTINGS для INSERT ... SELECT дедупа из CH_DEDUP_SETTINGS_JSON (JSON-объект),
+    например {"max_insert_threads": 8, "min_insert_block_size_rows": 1048576}.
+    Некорректный JSON не ломает публикацию: предупреждаем и работаем без дополнительных настроек.
+    """
+    raw = str(getattr(cfg, "CH_DEDUP_SETTINGS_JSON", "") or "").strip()
+    if not raw:
+        return {}
+    try:
+        extra = json.loads(raw)
+    except Exception as ex:
+        log.warning("CH_DEDUP_SETTINGS_JSON: некорректный JSON (%s) — игнорирую.", ex)
+        return {}
+    if not isinstance(extra, dict):
+        log.warning("CH_DEDUP_SETTINGS_JSON: ожидается JSON-объект, получено %s — игнорирую.", type(extra).__name__)
+        return {}
+    return extra
+
+
+def _settings_clause(settings: Dict[str, Any]) -> str:
+    """
+    {'k': v, ...} → ' SETTINGS k = v, ...' (пустая строка, если настроек нет).
+    Ключи, не похожие на идентификатор, пропускаем с предупреждением (как и некорректный JSON).
+    """
+    if not settings:
+        return ""
+    items: List[str] = []
+    for k, v in settings.items():
+        if not isinstance(k, str) or _SETTING_NAME_RE.fullmatch(k) is None:
+            log.warning("SETTINGS: некорректное имя настройки %r — игнорирую.", k)
+            continue
+        if isinstance(v, bool):
+            v = int(v)
+        if isinstance(v, (int, float)):
+            items.append(f"{k} = {v}")
+        else:
+            quoted = str(v).replace("\\", "\\\\").replace("'", "\\'")
+            items.append(f"{k} = '{quoted}'")
+    return " SETTINGS " + ", ".join(items) if items else ""
+
+
+def _dedup_select_sql(cfg: Settings, raw_all: str) -> Tuple[str, str]:
+    """
+    Части SELECT для дедупа партиции: (голова до WHERE, хвост после WHERE) по CH_PUBLISH_DEDUP_MODE.
+
+      • argmax   — GROUP BY c, opd, t + argMax(..., ingested_at) по каждой колонке (работает на любом
+                   MergeTree RAW; NULL в argMax пропускается — колонка берёт последнее непустое значение);
+      • limit_by — последняя по ingested_at строка целиком: ORDER BY ключ, ingested_at DESC LIMIT 1 BY ключ;
+                   без 25+ агрегатных состояний на группу, чтение в порядке ключа (optimize_read_in_order);
+      • final    — RAW на ReplacingMergeTree(ingested_at): SELECT ... FINAL без агрегатов; схлопывание
+                   делает движок, а do_not_merge_across_partitions_select_final не сливает данные между днями.
+
+    В limit_by/final берётся последняя строка целиком (NULL в ней остаётся NULL) — это отличие от argmax.
+    Настройки режима дополняются/переопределяются CH_DEDUP_SETTINGS_JSON (см. _dedup_extra_settings).
+    """
+    mode = str(getattr(cfg, "CH_PUBLISH_DEDUP_MODE", "argmax") or "argmax").strip().lower()
+    settings: Dict[str, Any] = {}
+    if mode == "final":
+        head = f"SELECT {CH_COLUMNS_STR} FROM {raw_all} FINAL "
+        tail = ""
+        settings["do_not_merge_across_partitions_select_final"] = 1
+    elif mode == "limit_by":
+        head = f"SELECT {CH_COLUMNS_STR} FROM {raw_all} "
+        tail = "ORDER BY c, opd, t, ingested_at DESC LIMIT 1 BY c, opd, t"
+        settings["optimize_read_in_order"] = 1
+    else:
+        # GROUP BY в порядке ключа сортировки таблиц (c, opd, t): при optimize_aggregation_in_order
+        # CH агрегирует потоком по уже отсортированным кускам, без полной хеш-таблицы на всю партицию
+        # (и без сброса во внешнюю агрегацию). Порядок колонок в GROUP BY на результат не влияет.
+        head = f"SELECT {DEDUP_SELECT_COLS} FROM {raw_all} "
+        tail = "GROUP BY c, opd, t"
+        if bool(getattr(cfg, "CH_PUBLISH_AGG_IN_ORDER", True)):
+            settings["optimize_aggregation_in_order"] = 1
+    settings.update(_dedup_extra_settings(cfg))
+    return head, (tail + _settings_clause(settings)).lstrip()
+
+
 # ------------------------------- Основная публикация (дедуп) -------------------------------
 
+def _publish_one_part(
+    execute: Callable[[str], Optional[List[tuple]]],
+    p: int,
+    *,
+    buf: str,
+    clean: str,
+    on_cluster: str,
+    select_head: str,
+    group_tail: str,
+    drop_buf: bool = True,
+) -> bool:
+    """
+    Одна партиция: DROP BUF → INSERT BUF (дедуп) → REPLACE CLEAN → DROP BUF (всегда).
+    drop_buf=False — BUF уже очищен TRUNCATE на всю публикацию: DROP PARTITION до/после не нужны.
+    Ошибка не пробрасывается — логируем и возвращаем False (партиция уйдёт в следующую публикацию).
+    """
+    try:
+        # 1) Страховочный DROP буферной партиции
+        if drop_buf:
+            try:
+                execute(f"ALTER TABLE {buf}{on_cluster} DROP PARTITION {p}")
+            except Exception:
+                pass  # не критично
+
+        # 2) Дедуп в буфере
+        insert_sql = (
+            f"INSERT INTO {buf} ({CH_COLUMNS_STR}) "
+            f"{select_head}"
+            f"WHERE toYYYYMMDD(opd) = {p} "
+            f"{group_tail}"
+        )
+        execute(insert_sql)
+
+        # 3) Публикация
+        replace_sql = f"ALTER TABLE {clean}{on_cluster} REPLACE PARTITION {p} FROM {buf}"
+        execute(replace_sql)
+        return True
+
+    except Exception as ex:
+        log.warning("Публикация партиции %s пропущена: %s", p, ex, exc_info=log.isEnabledFor(logging.DEBUG))
+        return False
+    finally:
+        # 4) Финальная уборка буфера — при любом исходе
+        if drop_buf:
+            try:
+                execute(f"ALTER TABLE {buf}{on_cluster} DROP PARTITION {p}")
+            except Exception:
+                pass
+
+
+def _truncate_buf(execute: Callable[[str], Optional[List[tuple]]], buf: str, on_cluster: str) -> bool:
+    """TRUNCATE буферной таблицы (best-effort). True — успешно."""
+    try:
+        execute(f"TRUNCATE TABLE {buf}{on_cluster}")
+        return True
+    except Exception as ex:
+        log.debug("TRUNCATE %s не удался (%s) — уборка буфера по партициям.", buf, ex)
+        return False
+
+
+def _publish_parts_parallel(
+    ch: CHClientLike,
+    parts_sorted: List[int],
+    workers: int,
+    one: Callable[[Callable[[str], Optional[List[tuple]]], int], bool],
+) -> Set[int]:
+    """
+    Параллельная публикация независимых партиций (разные YYYYMMDD не пересекаются по партам).
+    clickhouse-driver не потокобезопасен: у каждого потока пула своё соединение (ch.clone(),
+    создаётся лениво при первой партиции потока); все клоны закрываем по завершении.
+    Возвращает множество партиций, публикация которых не удалась.
+    """
+    from concurrent.futures import ThreadPoolExecutor  # лениво: нужен только при PUBLISH_PARALLELISM > 1
+
+    local = threading.local()
+    clones: List[Any] = []
+    clones_lock = threading.Lock()
+
+    def _execute_local(sql: str) -> Optional[List[tuple]]:
+        cli = getattr(local, "ch", None)
+        if cli is None:
+            cli = ch.clone()  # type: ignore[attr-defined]
+            local.ch = cli
+            with clones_lock:
+                clones.append(cli)
+        return cli.execute(sql)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ch-publish") as pool:
+            results = list(pool.map(lambda p: one(_execute_local, p), parts_sorted))
+    finally:
+        for cli in clones:
+            try:
+                cli.close()
+            except Exception:
+                pass
+    return {p for p, ok in zip(parts_sorted, results) if not ok}
+
+
 def publish_parts(
     ch: CHClientLike,
     cfg: Settings,
@@ -144,19 +333,38 @@ def publish_parts(
     process_name: str,
     parts: Set[int],
 ) -> bool:
+    """
+    Публикует набор партиций (см. publish_parts_failed).
+    Возвращает True, если была выполнена хотя бы одна REPLACE PARTITION.
+    """
+    if not parts:
+        return False
+    failed = publish_parts_failed(ch, cfg, pg, process_name, parts)
+    return len(failed) < len(set(int(p) for p in parts))
+
+
+def publish_parts_failed(
+    ch: CHClientLike,
+    cfg: Settings,
+    pg: PGClientLike,
+    process_name: str,
+    parts: Set[int],
+) -> Set[int]:
     """
     Публикует набор партиций из RAW в CLEAN с дедупом:
 
       1) DROP BUF (если есть хвост от прошлого запуска);
-      2) INSERT INTO BUF SELECT ... FROM RAW GROUP BY c, t, opd
-         (значения колонок — argMax(..., ingested_at));
+      2) INSERT INTO BUF SELECT ... FROM RAW GROUP BY c, opd, t
+         (значения колонок — argMax(..., ingested_at)); режимы limit_by/final — см. _dedup_select_sql;
       3) REPLACE PARTITION <p> FROM BUF в CLEAN;
       4) DROP BUF (всегда, как бы ни прошёл REPLACE).
+    При CH_PUBLISH_BUF_TRUNCATE=1 шаги 1 и 4 заменяет один TRUNCATE BUF до и после всего набора.
 
-    Возвращает True, если была выполнена хотя бы одна REPLACE PARTITION.
+    При PUBLISH_PARALLELISM > 1 партиции публикуются параллельно (своё CH-соединение на поток).
+    Возвращает множество партиций, публикация которых не удалась (пустое — всё опубликовано).
     """
     if not parts:
-        return False
+        return set()
 
     execute: Callable[[str], Optional[List[tuple]]] = ch.execute
     on_cluster = _on_cluster_suffix(cfg)
@@ -181,40 +389,30 @@ def publish_parts(
     except Exception:
         pass
 
-    published_any = False
     parts_sorted = sorted(set(int(p) for p in parts))
 
-    for p in parts_sorted:
-        try:
-            # 1) Страховочный DROP буферной партиции
-            try:
-                execute(f"ALTER TABLE {buf}{on_cluster} DROP PARTITION {p}")
-            except Exception:
-                pass  # не критично
+    select_head, group_tail = _dedup_select_sql(cfg, raw_all)
 
-            # 2) Дедуп в буфере
-            insert_sql = (
-                f"INSERT INTO {buf} ({CH_COLUMNS_STR}) "
-                f"SELECT {DEDUP_SELECT_COLS} "
-                f"FROM {raw_all} "
-                f"WHERE toYYYYMMDD(opd) = {p} "
-                f"GROUP BY c, t, opd"
-            )
-            execute(insert_sql)
-
-            # 3) Публикация
-            replace_sql = f"ALTER TABLE {clean}{on_cluster} REPLACE PARTITION {p} FROM {buf}"
-            execute(replace_sql)
-            published_any = True
+    # Опционально (CH_PUBLISH_BUF_TRUNCATE=1): один TRUNCATE до и после публикации вместо двух
+    # DROP PARTITION на каждую партицию (для Replicated — меньше метаданных/операций в ZooKeeper).
+    # BUF общий для X и manual_X (у них разные advisory-lock), а TRUNCATE задевает чужие партиции,
+    # поэтому по умолчанию выключено. Если TRUNCATE не прошёл — по-старому, DROP PARTITION на партицию.
+    truncated = bool(getattr(cfg, "CH_PUBLISH_BUF_TRUNCATE", False)) and _truncate_buf(execute, buf, on_cluster)
 
-        except Exception as ex:
-            log.warning("Публикация партиции %s пропущена: %s", p, ex, exc_info=log.isEnabledFor(logging.DEBUG))
-        finally:
-            # 4) Финальная уборка буфера — при любом исходе
-            try:
-                execute(f"ALTER TABLE {buf}{on_cluster} DROP PARTITION {p}")
-            except Exception:
-                pass
+    def _one(run: Callable[[str], Optional[List[tuple]]], p: int) -> bool:
+        return _publish_one_part(
+            run, p, buf=buf, clean=clean, on_cluster=on_cluster,
+            select_head=select_head, group_tail=group_tail, drop_buf=not truncated,
+        )
+
+    workers = min(int(getattr(cfg, "PUBLISH_PARALLELISM", 1) or 1), len(parts_sorted))
+    if workers > 1 and hasattr(ch, "clone"):
+        failed = _publish_parts_parallel(ch, parts_sorted, workers, _one)
+    else:
+        failed = {p for p in parts_sorted if not _one(execute, p)}
+
+    if truncated:
+        _truncate_buf(execute, buf, on_cluster)
 
     try:
         if dedup_journal:
@@ -222,13 +420,97 @@ def publish_parts(
     except Exception:
         pass
 
-    return published_any
+    return failed
 
 
 # Обратная совместимость со старым именем
 _publish_parts = publish_parts
 
 
+# ------------------------------- Фоновая публикация -------------------------------
+
+class BackgroundPublisher:
+    """
+    Однопоточная фоновая публикация: промежуточные REPLACE PARTITION уходят в отдельный поток,
+    а основной цикл сразу переходит к следующему слайсу (публикация снимается с критического пути).
+
+    Особенности:
+    - clickhouse-driver не потокобезопасен, а PGClient держит один курсор, поэтому у фонового
+      потока свои CH- и PG-соединения (создаются лениво фабриками ch_factory/pg_factory внутри
+      рабочего потока, например ch.clone/pg.clone) — журнал дедупа не делит курсор с основным циклом;
+    - один воркер → публикации выполняются строго в порядке постановки;
+    - на вход берём frozenset-снимок партиций, так что основной поток может сразу чистить pending_parts;
+    - неудачные партиции (publish_parts_failed; при исключении — весь снимок) возвращает drain_failed(),
+      чтобы основной цикл вернул их в pending_parts и они попали в следующую/финальную публикацию.
+    """
+
+    def __init__(
+        self,
+        ch_factory: Callable[[], CHClientLike],
+        cfg: Settings,
+        pg_factory: Callable[[], PGClientLike],
+        process_name: str,
+    ) -> None:
+        from concurrent.futures import ThreadPoolExecutor  # лениво: нужен только при фоновой публикации
+        self._ch_factory = ch_factory
+        self._pg_factory = pg_factory
+        self._cfg = cfg
+        self._process_name = process_name
+        self._ch: Optional[CHClientLike] = None
+        self._pg: Optional[PGClientLike] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ch-publish")
+        self._inflight: List[Tuple[frozenset, Any]] = []
+
+    def _run(self, parts: frozenset) -> Set[int]:
+        if self._ch is None:
+            self._ch = self._ch_factory()
+        if self._pg is None:
+            self._pg = self._pg_factory()
+        return publish_parts_failed(self._ch, self._cfg, self._pg, self._process_name, set(parts))
+
+    def submit(self, parts: Iterable[int]) -> frozenset:
+        """Ставит публикацию снимка партиций в очередь; возвращает сам снимок."""
+        snapshot = frozenset(int(p) for p in parts)
+        if snapshot:
+            self._inflight.append((snapshot, self._executor.submit(self._run, snapshot)))
+        return snapshot
+
+    def drain_failed(self, *, wait: bool = False) -> Set[int]:
+        """
+        Собирает завершившиеся публикации (wait=True — дожидается всех поставленных).
+        Возвращает партиции, публикация которых не удалась.
+        """
+        failed: Set[int] = set()
+        pending: List[Tuple[frozenset, Any]] = []
+        for snapshot, fut in self._inflight:
+            if not wait and not fut.done():
+                pending.append((snapshot, fut))
+                continue
+            try:
+                failed |= fut.result()
+            except Exception as ex:
+                log.warning("Фоновая публикация партиций %s упала: %s", sorted(snapshot), ex,
+                            exc_info=log.isEnabledFor(logging.DEBUG))
+                failed |= snapshot
+        self._inflight = pending
+        return failed
+
+    def close(self) -> None:
+        """Дожидается очереди публикаций и закрывает собственные CH/PG-соединения (best-effort)."""
+        try:
+            self._executor.shutdown(wait=True)
+        finally:
+            clients = (self._ch, self._pg)
+            self._ch = self._pg = None
+            for cli in clients:
+                try:
+                    close = getattr(cli, "close", None)
+                    if callable(close):
+                        close()
+                except Exception:
+                    pass
+
+
 # ------------------------------- Финальная публикация / бэкфилл -------------------------------
 
 def _dt_to_dt64_utc_str(dt: datetime) -> str:
@@ -320,9 +602,11 @@ def finalize_publication(
 __all__ = [
     # публичные функции
     "publish_parts",
+    "publish_parts_failed",
     "select_parts_to_publish",
     "log_gating_debug",
     "perform_startup_backfill",
     "finalize_publication",
+    "BackgroundPublisher",
     "publish_parts",
 ]
\ No newline at end of file
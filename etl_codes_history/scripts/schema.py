@@ -18,7 +18,7 @@
 
 from __future__ import annotations
 
-from typing import Tuple
+from typing import FrozenSet, Tuple
 
 # ---------------------------------------------------------------------------
 # БАЗОВАЯ СХЕМА СЫРЫХ ДАННЫХ (RAW/BUF/CLEAN)
@@ -38,6 +38,15 @@ CH_COLUMNS: Tuple[str, ...] = (
     "pvad", "ag",
 )
 
+# Типы колонок (по DDL RAW) — по ним строится план конвертации значений Phoenix перед INSERT.
+# frozenset: проверка принадлежности за один хэш-пробой, наборы неизменяемы.
+CH_DT_FIELDS: FrozenSet[str] = frozenset({"opd", "emd", "apd", "exd", "tm"})  # DateTime64(3)
+CH_INT8_FIELDS: FrozenSet[str] = frozenset({"t", "st", "ste", "elr", "pt", "et"})  # UInt8
+CH_INT16_FIELDS: FrozenSet[str] = frozenset({"pg"})                                 # UInt16
+CH_INT64_FIELDS: FrozenSet[str] = frozenset({"tt"})                                 # Int64
+# Все целочисленные одним набором — одна проверка вместо цепочки `or`
+CH_INT_FIELDS: FrozenSet[str] = CH_INT8_FIELDS | CH_INT16_FIELDS | CH_INT64_FIELDS
+
 # Часто используемые строковые представления (предвычисляем один раз, чтобы не делать join в «горячем пути»)
 CH_COLUMNS_STR: str = ", ".join(CH_COLUMNS)
 
@@ -60,6 +69,11 @@ DEDUP_SELECT_COLS: str = "c, t, opd,\n              " + DEDUP_AGG_EXPRS
 __all__ = [
     "CH_COLUMNS",
     "CH_COLUMNS_STR",
+    "CH_DT_FIELDS",
+    "CH_INT8_FIELDS",
+    "CH_INT16_FIELDS",
+    "CH_INT64_FIELDS",
+    "CH_INT_FIELDS",
     "DEDUP_KEY_COLS",
     "NON_KEY_COLS",
     "DEDUP_AGG_EXPRS",
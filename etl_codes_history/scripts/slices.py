@@ -23,31 +23,20 @@
 from __future__ import annotations
 
 import logging
-from datetime import datetime, timezone
-from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple, TYPE_CHECKING
+from collections import Counter
+from itertools import repeat
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from operator import itemgetter
+from typing import AbstractSet, Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, TYPE_CHECKING
 
 log = logging.getLogger("codes_history_increment")
 
-# ---- Импорт схемы колонок CH (порядок критичен для быстрой вставки) ----
-try:
-    from .schema import CH_COLUMNS, CH_DT_FIELDS, CH_INT_FIELDS  # type: ignore[attr-defined]
-except Exception:
-    # Fallback: минимально достаточный набор. Как только добавишь schema.py — этот блок можно удалить.
-    CH_COLUMNS: Tuple[str, ...] = (
-        "c","t","opd",                    # составной ключ (пример)
-        "id","did",
-        "rid","rinn","rn","sid","sinn","sn","gt","prid",
-        "st","ste","elr",
-        "emd","apd","exd",               # даты/времена доменные
-        "p","pt","o","pn","b",
-        "tt","tm",                       # метки времени
-        "ch","j",
-        "pg","et",
-        "pvad","ag",
-        # ingested_at не перечисляем — он вычисляется/добавляется на другой стадии (RAW)
-    )
-    CH_DT_FIELDS: Set[str] = {"opd", "emd", "apd", "exd", "tt", "tm"}
-    CH_INT_FIELDS: Set[str] = {"id", "did", "rid", "rinn", "rn", "sid", "sinn", "st", "ste", "elr", "pt", "o", "b", "pg", "et", "pvad", "ag"}
+# ---- Импорт схемы колонок CH (порядок и типы критичны для быстрой вставки) ----
+from .schema import CH_COLUMNS, CH_DT_FIELDS, CH_INT_FIELDS
+
+# ---- Фоновое чтение через ограниченную очередь (конвейер слайса и предвыборка) ----
+from .db.prefetch import PrefetchIterator
 
 # ---- Типы клиентов (мягкие протоколы) ----
 if TYPE_CHECKING:
@@ -78,27 +67,63 @@ else:
 # ВСПОМОГАТЕЛЬНЫЕ УТИЛИТЫ (микрооптимизированы под горячий путь)
 # -----------------------------------------------------------------------------
 
+_EPOCH = datetime(1970, 1, 1)  # naive UTC-эпоха для epoch-чисел (мс/сек)
+
+
 def _to_utc_naive(dt: Any) -> Optional[datetime]:
     """Гарантируем naive UTC (tzinfo=None) для разных входов (datetime/epoch/ISO-строка)."""
     if dt is None:
         return None
 
+    # Быстрый путь: Phoenix (PQS) обычно уже отдаёт naive datetime — проверка идентичности класса
+    # дешевле isinstance; остаётся только усечение до миллисекунд (DateTime64(3) в CH).
+    # Если микросекунды уже кратны 1000 — объект отдаётся как есть, без replace().
+    if dt.__class__ is datetime:
+        tz = dt.tzinfo
+        us = dt.microsecond
+        if tz is None:
+            return dt if not us % 1000 else dt.replace(microsecond=us - us % 1000)
+        if tz is not timezone.utc:
+            dt = dt.astimezone(timezone.utc)
+        # aware → naive UTC и усечение до мс — одним replace()
+        return dt.replace(tzinfo=None, microsecond=us - us % 1000)
+
+    # Epoch-целое (мс/сек) — сразу naive UTC, до цепочки isinstance: сложение с naive _EPOCH
+    # целочисленное (без float и без устаревшего в 3.12 utcfromtimestamp).
+    if dt.__class__ is int:
+        return _EPOCH + (timedelta(milliseconds=dt) if dt > 10**12 else timedelta(seconds=dt))
+
     if isinstance(dt, datetime):
-        if dt.tzinfo is timezone.utc:
-            return dt.replace(tzinfo=None)
-        if dt.tzinfo is None:
-            return dt
-        return dt.astimezone(timezone.utc).replace(tzinfo=None)
+        # Подклассы datetime (pandas.Timestamp и т.п.) — тот же контракт: naive UTC, усечение до мс
+        if dt.tzinfo is not None and dt.tzinfo is not timezone.utc:
+            dt = dt.astimezone(timezone.utc)
+        us = dt.microsecond
+        return dt.replace(tzinfo=None, microsecond=us - us % 1000)
 
     if isinstance(dt, (int, float)):
         if dt > 10**12:  # эвристика: мс
-            dt = dt / 1000.0
-        return datetime.utcfromtimestamp(float(dt))
+            return _EPOCH + timedelta(milliseconds=dt)
+        return _EPOCH + timedelta(seconds=dt)
 
     if isinstance(dt, str):
         s = dt.strip()
         if not s:
             return None
+        # Быстрый путь для канонического «YYYY-MM-DD HH:MM:SS[.fff][Z]»: срезы + int() вместо
+        # strptime (тот на каждый вызов разбирает формат). Дробная часть сразу усекается до мс.
+        if len(s) >= 19 and s[4] == "-" and s[7] == "-" and s[10] in " T" and s[13] == ":" and s[16] == ":":
+            tail = s[19:]
+            if tail[-1:] == "Z":
+                tail = tail[:-1]
+            if not tail or (tail[0] == "." and tail[1:].isdigit()):
+                try:
+                    return datetime(
+                        int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                        int(s[11:13]), int(s[14:16]), int(s[17:19]),
+                        int((tail[1:] + "000")[:3]) * 1000 if tail else 0,
+                    )
+                except ValueError:
+                    pass
         s = s.replace("T", " ")
         if s.endswith("Z"):
             s = s[:-1]
@@ -106,8 +131,8 @@ def _to_utc_naive(dt: Any) -> Optional[datetime]:
         try:
             base = datetime.strptime(main, "%Y-%m-%d %H:%M:%S")
             if dot and frac:
-                us = int((frac + "000000")[:6])
-                base = base.replace(microsecond=us)
+                # Как и в быстром пути — только миллисекунды (DateTime64(3))
+                base = base.replace(microsecond=int((frac + "000")[:3]) * 1000)
             return base
         except Exception:
             return None
@@ -115,6 +140,23 @@ def _to_utc_naive(dt: Any) -> Optional[datetime]:
     return None
 
 
+def _as_int(v: Any) -> Optional[int]:
+    """Мягкое приведение к int: int отдаём как есть (частый случай из PQS), мусор -> None."""
+    if v.__class__ is int:
+        return v
+    if v is None:
+        return None
+    if v.__class__ is str:
+        # Проверка вместо исключения: пустые/мусорные строки не платят за raise/except
+        s = v.strip()
+        digits = s[1:] if s[:1] in ("-", "+") else s
+        return int(s) if digits.isdigit() and digits.isascii() else None
+    try:
+        return int(v)
+    except Exception:
+        return None
+
+
 def _opd_to_part_utc(opd: Any) -> Optional[int]:
     """Перевод opc/opd в номер партиции UTC (YYYYMMDD)."""
     dt = _to_utc_naive(opd)
@@ -123,34 +165,215 @@ def _opd_to_part_utc(opd: Any) -> Optional[int]:
     return dt.year * 10000 + dt.month * 100 + dt.day
 
 
+# Колонка-массив (Array(String) в CH). Источник может отдать её списком или строкой вида
+# "a;b|c" / "[a,b]" — нормализуем одной таблицей str.translate: разделители -> ",",
+# скобки удаляем (один проход на C-уровне, без цепочки .replace и промежуточных строк).
+CH_ARRAY_FIELD = "ch"
+_CH_SEP_TRANS = str.maketrans({";": ",", "|": ",", "[": None, "]": None,
+                               "{": None, "}": None, "(": None, ")": None})
+
+
+def _parse_ch_array(v: Any) -> List[str]:
+    """Значение `ch` -> list[str] для Array(String); пустые элементы отбрасываем."""
+    if v is None:
+        return []
+    if v.__class__ is list:
+        # Частый случай из PQS — уже готовый список непустых строк: одна копия на C-уровне без
+        # фильтрации. Копия обязательна — результат уходит в буферы чанков, которые переиспользуются.
+        if all(x.__class__ is str and x for x in v):
+            return list(v)
+        return [str(x) for x in v if x is not None and x != ""]
+    if isinstance(v, (list, tuple)):
+        return [str(x) for x in v if x is not None and x != ""]
+    norm = (v if v.__class__ is str else str(v)).translate(_CH_SEP_TRANS)
+    if "," not in norm:
+        # Частый случай — один код без разделителей: без split и цикла.
+        item = norm.strip().strip('"\'')
+        return [item] if item else []
+    out: List[str] = []
+    for item in norm.split(","):
+        item = item.strip().strip('"\'')
+        if item:
+            out.append(item)
+    return out
+
+
+def _column_converter(col: str,
+                      dt_fields: AbstractSet[str] = CH_DT_FIELDS,
+                      int_fields: AbstractSet[str] = CH_INT_FIELDS) -> Optional[Callable[[Any], Any]]:
+    """Конвертер значения колонки (те же правила, что в _row_to_ch_tuple); None — значение как есть."""
+    if col == CH_ARRAY_FIELD:
+        return _parse_ch_array
+    if col in dt_fields:
+        return _to_utc_naive
+    if col in int_fields:
+        return _as_int
+    return None
+
+
+# (колонка, конвертер) на каждую колонку CH — строятся один раз при импорте
+_COLUMN_PLAN: Tuple[Tuple[str, Optional[Callable[[Any], Any]]], ...] = tuple(
+    (c, _column_converter(c)) for c in CH_COLUMNS
+)
+
+
+def _compile_row_converter(
+    plan: Sequence[Tuple[str, Optional[Callable[[Any], Any]]]],
+) -> Callable[[Dict[str, Any]], tuple]:
+    """
+    Специализация плана в одну функцию dict -> tuple: исходник вида
+    `return (get('c'), _c1(get('t')), ...)` собирается и компилируется один раз при импорте.
+    Цикл по колонкам, распаковка пар плана и ветвление на конвертер уходят из «горячего» пути.
+    """
+    ns: Dict[str, Any] = {}
+    items: List[str] = []
+    for i, (col, conv) in enumerate(plan):
+        if conv is None:
+            items.append(f"get({col!r})")
+        else:
+            ns[f"_c{i}"] = conv
+            items.append(f"_c{i}(get({col!r}))")
+    src = "def _row_fn(row):\n    get = row.get\n    return (" + ", ".join(items) + ",)\n"
+    exec(compile(src, "<slices:_row_fn>", "exec"), ns)
+    return ns["_row_fn"]
+
+
+_ROW_TO_TUPLE_FAST: Callable[[Dict[str, Any]], tuple] = _compile_row_converter(_COLUMN_PLAN)
+
+
 def _row_to_ch_tuple(row: Dict[str, Any],
                      columns: Sequence[str] = CH_COLUMNS,
-                     dt_fields: Set[str] = CH_DT_FIELDS,
-                     int_fields: Set[str] = CH_INT_FIELDS) -> tuple:
-    """Быстрая конвертация dict -> tuple под порядок колонок ClickHouse."""
+                     dt_fields: AbstractSet[str] = CH_DT_FIELDS,
+                     int_fields: AbstractSet[str] = CH_INT_FIELDS) -> tuple:
+    """
+    Быстрая конвертация dict -> tuple под порядок колонок ClickHouse.
+    Для схемы по умолчанию — скомпилированная из плана функция (_ROW_TO_TUPLE_FAST): на ячейку
+    один вызов конвертера без проверок принадлежности к наборам; конвертеры сами пропускают None.
+    """
+    if columns is CH_COLUMNS and dt_fields is CH_DT_FIELDS and int_fields is CH_INT_FIELDS:
+        return _ROW_TO_TUPLE_FAST(row)
+
     get = row.get
     out: List[Any] = [None] * len(columns)
     for i, col in enumerate(columns):
         v = get(col)
+        if col == CH_ARRAY_FIELD:
+            # Array(String) в CH не Nullable — None превращаем в пустой массив
+            out[i] = _parse_ch_array(v)
+            continue
         if v is None:
             out[i] = None
             continue
         if col in dt_fields:
             out[i] = _to_utc_naive(v)
         elif col in int_fields:
-            try:
-                out[i] = int(v)
-            except Exception:
-                out[i] = None
+            out[i] = _as_int(v)
         else:
             out[i] = v
     return tuple(out)
 
 
+def _rows_to_ch_tuples(
+    rows: Iterable[Dict[str, Any]],
+    to_tuple: Callable[[Dict[str, Any]], tuple] = _row_to_ch_tuple,
+) -> List[tuple]:
+    """
+    Батчевая конвертация: один list(map(...)) вместо Python-цикла с append на каждый ряд.
+    Для стандартного конвертера батч идёт через колонки: map по каждой колонке + zip(*cols)
+    собирают кортежи на C-уровне — Python-кадра на строку нет вовсе, вызываются только
+    конвертеры дат/целых/массива, а «сырые» колонки копируются без интерпретатора.
+    """
+    if to_tuple is _row_to_ch_tuple:
+        if not isinstance(rows, (list, tuple)):
+            rows = list(rows)
+        return list(zip(*_rows_to_ch_columns(rows))) if rows else []
+    names = getattr(rows, "names", None)
+    if names is not None:
+        # Пользовательский конвертер ждёт dict — для позиционного батча собираем их только здесь
+        rows = [dict(zip(names, r)) for r in rows]
+    return list(map(to_tuple, rows))
+
+
+@lru_cache(maxsize=16)
+def _positional_plan(names: Tuple[str, ...]) -> Tuple[Tuple[Optional[int], Optional[Callable[[Any], Any]]], ...]:
+    """
+    План для позиционного батча (RowBatch): (индекс в строке Phoenix | None, конвертер) на каждую
+    колонку CH. Строится один раз на набор колонок SELECT; имена сравниваем без учёта регистра.
+    """
+    pos = {str(n).strip('"').lower(): i for i, n in enumerate(names)}
+    return tuple((pos.get(c), conv) for c, conv in _COLUMN_PLAN)
+
+
+_OPD_PLAN_IDX = CH_COLUMNS.index("opd")
+
+
+def _batch_opd_values(batch: Sequence[Any]) -> Iterable[Any]:
+    """Значения opd батча (dict-строки или позиционный RowBatch) — итератор на C-уровне."""
+    names = getattr(batch, "names", None)
+    if names is None:
+        return map(dict.get, batch, repeat("opd"))
+    idx = _positional_plan(names)[_OPD_PLAN_IDX][0]
+    return repeat(None, len(batch)) if idx is None else map(itemgetter(idx), batch)
+
+
+def _rows_to_ch_columns(rows: Sequence[Any]) -> List[List[Any]]:
+    """
+    Батч Phoenix → колонки CH (SoA): по одному списку на колонку в порядке CH_COLUMNS.
+    Каждая колонка — один map() на C-уровне (dict.get + repeat(col) заметно дешевле
+    methodcaller); кортежи на строку не создаются вовсе.
+    Позиционный батч (RowBatch с .names) транспонируется одним zip(*rows) — без dict вообще.
+    """
+    names = getattr(rows, "names", None)
+    if names is not None:
+        return _positional_rows_to_ch_columns(rows, names)
+    out: List[List[Any]] = []
+    dget = dict.get
+    for col, conv in _COLUMN_PLAN:
+        vals = map(dget, rows, repeat(col))
+        out.append(list(map(conv, vals)) if conv is not None else list(vals))
+    return out
+
+
+def _positional_rows_to_ch_columns(rows: Sequence[Sequence[Any]], names: Tuple[str, ...]) -> List[List[Any]]:
+    """Позиционный вариант _rows_to_ch_columns: колонки по индексу из _positional_plan(names)."""
+    n = len(rows)
+    src = list(zip(*rows)) if n else []
+    out: List[List[Any]] = []
+    for idx, conv in _positional_plan(names):
+        vals = repeat(None, n) if idx is None else src[idx]
+        out.append(list(map(conv, vals)) if conv is not None else list(vals))
+    return out
+
+
 # -----------------------------------------------------------------------------
 # БЫСТРАЯ ВСТАВКА В CH
 # -----------------------------------------------------------------------------
 
+# Позиции колонок ключа сортировки таблиц (ORDER BY (c, opd, t)) в CH_COLUMNS
+_SORT_KEY_IDX: Tuple[int, ...] = tuple(CH_COLUMNS.index(c) for c in ("c", "opd", "t"))
+
+
+def _presort_chunk(chunk: List[Any], columnar: bool) -> None:
+    """
+    Сортирует чанк по ключу таблиц (c, opd, t) на месте: уже упорядоченный блок CH пишет
+    в парт без собственной сортировки. Колоночный чанк переставляется одной перестановкой
+    на все колонки (списки сохраняют идентичность — буфер можно переиспользовать).
+    Несравнимые значения ключа (None) — оставляем порядок как есть.
+    """
+    try:
+        if not columnar:
+            chunk.sort(key=itemgetter(*_SORT_KEY_IDX))
+            return
+        if not chunk or len(chunk[0]) < 2:
+            return
+        keys = list(zip(*(chunk[i] for i in _SORT_KEY_IDX)))
+        perm = sorted(range(len(keys)), key=keys.__getitem__)
+        for col in chunk:
+            col[:] = map(col.__getitem__, perm)
+    except TypeError:
+        pass
+
+
 def _flush_ch_buffer(
     ch: ClickHouseLike,
     table: str,
@@ -208,9 +431,7 @@ def _proc_phx_batch(
     """Проход по батчу из Phoenix с конвертацией в кортежи CH (без флаша)."""
     if not rows:
         return 0
-    append = out_buf.append
-    for r in rows:
-        append(to_tuple(r))
+    out_buf.extend(_rows_to_ch_tuples(rows, to_tuple))
     return len(rows)
 
 
@@ -257,7 +478,6 @@ def _process_one_slice(
     fetch_iter = phx.fetch_increment_adaptive
     _flush = _flush_ch_buffer
     execute = ch.execute
-    append_part = set.add
 
     try:
         journal.mark_running(slice_from, slice_to)
@@ -276,10 +496,8 @@ def _process_one_slice(
 
             rows_read += _proc_phx_batch(batch, buffer, to_tuple)
 
-            for r in batch:
-                p = _opd_to_part_utc(r.get("opd"))
-                if p is not None:
-                    append_part(parts, p)
+            # set.update сам проходит по генератору (None отсекает filter; партиция 0 невозможна)
+            parts.update(filter(None, map(_opd_to_part_utc, _batch_opd_values(batch))))
 
             if len(buffer) >= ch_batch_rows:
                 rows_written += _flush(ch, ch_target_table, buffer, CH_COLUMNS, insert_values)
@@ -352,6 +570,233 @@ def resolve_phx_table_and_cols(cfg: Any) -> Tuple[str, str, Tuple[str, ...]]:
     return table, ts_col, phx_cols
 
 
+def _track_batch_parts(
+    batch: Sequence[Dict[str, Any]],
+    opd_to_part: Callable[[Any], Optional[int]],
+    pending_parts: Set[int],
+    new_rows_since_pub_by_part: Dict[int, int],
+) -> None:
+    """
+    Учёт партиций батча: Counter считает строки по партициям на C-уровне (в батче обычно 1–2 дня),
+    поэтому pending_parts/счётчики обновляются раз на партицию, а не на каждую строку.
+    """
+    counts = Counter(map(opd_to_part, _batch_opd_values(batch)))
+    counts.pop(None, None)
+    pending_parts.update(counts)
+    get_count = new_rows_since_pub_by_part.get
+    for p, n in counts.items():
+        new_rows_since_pub_by_part[p] = get_count(p, 0) + n
+
+
+def _iter_ch_chunks(
+    batches: Iterable[Sequence[Dict[str, Any]]],
+    ch_batch: int,
+    row_to_tuple: Callable[[Dict[str, Any]], tuple],
+    opd_to_part: Callable[[Any], Optional[int]],
+    pending_parts: Set[int],
+    new_rows_since_pub_by_part: Dict[int, int],
+    counters: List[int],
+    columnar: bool = False,
+    reuse_buffer: bool = False,
+) -> Iterator[List[Any]]:
+    """
+    Генератор готовых к вставке чанков: конвертирует ряды Phoenix в кортежи CH,
+    обновляет pending_parts/счётчики партиций и отдаёт буфер, как только он достиг ch_batch
+    (хвост — в конце). counters[0] — накопленное число прочитанных рядов (для heartbeat).
+    columnar=True — чанк по колонкам (список на колонку CH, см. _rows_to_ch_columns).
+    reuse_buffer=True — один предвыделенный буфер на весь слайс (см. _iter_ch_chunks_pooled);
+    допустимо, только если потребитель обрабатывает чанк до следующего next().
+    """
+    if columnar:
+        yield from _iter_ch_column_chunks(
+            batches, ch_batch, opd_to_part, pending_parts, new_rows_since_pub_by_part, counters,
+        )
+        return
+    if reuse_buffer:
+        yield from _iter_ch_chunks_pooled(
+            batches, ch_batch, row_to_tuple, opd_to_part, pending_parts, new_rows_since_pub_by_part, counters,
+        )
+        return
+
+    buf: List[tuple] = []
+    rows_to_tuples = _rows_to_ch_tuples
+
+    for batch in batches:
+        if not batch:
+            continue
+
+        # Конвертация целым батчем (map на C-уровне), затем — учёт партиций
+        buf.extend(rows_to_tuples(batch, row_to_tuple))
+        _track_batch_parts(batch, opd_to_part, pending_parts, new_rows_since_pub_by_part)
+
+        counters[0] += len(batch)
+
+        if len(buf) >= ch_batch:
+            yield buf
+            # Новый список, а не clear(): отданный чанк может ещё лежать в очереди конвейера
+            buf = []
+
+    if buf:
+        yield buf
+
+
+def _iter_ch_column_chunks(
+    batches: Iterable[Sequence[Dict[str, Any]]],
+    ch_batch: int,
+    opd_to_part: Callable[[Any], Optional[int]],
+    pending_parts: Set[int],
+    new_rows_since_pub_by_part: Dict[int, int],
+    counters: List[int],
+) -> Iterator[List[List[Any]]]:
+    """Колоночный вариант _iter_ch_chunks: буфер — список колонок, размер — длина первой колонки."""
+    n_cols = len(CH_COLUMNS)
+    cols: List[List[Any]] = [[] for _ in range(n_cols)]
+
+    for batch in batches:
+        if not batch:
+            continue
+
+        for buf_col, vals in zip(cols, _rows_to_ch_columns(batch)):
+            buf_col.extend(vals)
+        _track_batch_parts(batch, opd_to_part, pending_parts, new_rows_since_pub_by_part)
+
+        counters[0] += len(batch)
+
+        if len(cols[0]) >= ch_batch:
+            yield cols
+            cols = [[] for _ in range(n_cols)]
+
+    if cols[0]:
+        yield cols
+
+
+def _iter_ch_chunks_pooled(
+    batches: Iterable[Sequence[Dict[str, Any]]],
+    ch_batch: int,
+    row_to_tuple: Callable[[Dict[str, Any]], tuple],
+    opd_to_part: Callable[[Any], Optional[int]],
+    pending_parts: Set[int],
+    new_rows_since_pub_by_part: Dict[int, int],
+    counters: List[int],
+) -> Iterator[List[tuple]]:
+    """
+    Вариант _iter_ch_chunks с одним буфером [None] * ch_batch и индексом записи n:
+    кортежи кладутся срезом на место (список не растёт и не перевыделяется), полный буфер
+    отдаётся как есть — ровно ch_batch строк, хвост — срезом pool[:n].
+    Только для последовательного режима: буфер перезаписывается сразу после возврата из yield.
+    """
+    pool: List[Any] = [None] * ch_batch
+    n = 0
+    rows_to_tuples = _rows_to_ch_tuples
+
+    for batch in batches:
+        if not batch:
+            continue
+
+        tuples = rows_to_tuples(batch, row_to_tuple)
+        _track_batch_parts(batch, opd_to_part, pending_parts, new_rows_since_pub_by_part)
+        counters[0] += len(batch)
+
+        i, k = 0, len(tuples)
+        while i < k:
+            take = min(ch_batch - n, k - i)
+            pool[n:n + take] = tuples if (i == 0 and take == k) else tuples[i:i + take]
+            n += take
+            i += take
+            if n == ch_batch:
+                yield pool
+                n = 0
+
+    if n:
+        yield pool[:n]
+
+
+def _run_pipelined(
+    chunks: Iterator[List[tuple]],
+    consume: Callable[[List[tuple]], None],
+    queue_size: int,
+) -> None:
+    """
+    Конвейер producer/consumer: фоновый поток читает Phoenix и готовит чанки (chunks),
+    текущий поток вставляет их в CH (consume). Очередь ограничена queue_size — память
+    не растёт, а сетевой I/O к Phoenix и к ClickHouse перекрывается.
+
+    Ошибка производителя пробрасывается потребителю; ошибка потребителя останавливает
+    производителя (выход из with → close() очереди).
+    """
+    with _iter_prefetched(chunks, queue_size, "phx-prefetch") as it:
+        for chunk in it:
+            consume(chunk)
+
+
+def _iter_prefetched(source: Iterable[Any], queue_size: int, name: str = "phx-fetch") -> PrefetchIterator:
+    """
+    Чтение источника в фоновом потоке через ограниченную очередь (db.prefetch.PrefetchIterator):
+    сетевое ожидание Phoenix перекрывается с работой потребителя. Ошибка источника
+    пробрасывается потребителю; close() останавливает поток на ближайшем put().
+    """
+    return PrefetchIterator((source,), queue_size, name)
+
+
+class SlicePrefetcher:
+    """
+    Предвыборка следующего слайса: пока текущий дописывает хвост в CH, публикует и закрывает
+    слайс в журнале, фоновый поток уже выполняет запрос в Phoenix для [s_q; e_q) следующего
+    и складывает батчи в ограниченную очередь (вперёд читается не больше queue_size батчей).
+
+    • Своё Phoenix-соединение (phx_factory вызывается лениво в фоновом потоке).
+    • take(s_q, e_q) отдаёт итератор предвыбранных батчей, только если окно совпадает;
+      иначе предвыборка отменяется и вызывающий читает Phoenix как обычно.
+    • Ошибка фонового чтения пробрасывается из итератора в потоке-потребителе.
+    """
+
+    def __init__(self, phx_factory: Callable[[], PhoenixLike], queue_size: int) -> None:
+        self._phx_factory = phx_factory
+        self._phx: Optional[PhoenixLike] = None
+        self._queue_size = max(1, int(queue_size))
+        self._key: Optional[Tuple[datetime, datetime]] = None
+        self._it: Optional[PrefetchIterator] = None
+
+    def _batches(self, table: str, ts_col: str, columns: Sequence[str], s_q: datetime, e_q: datetime) -> Iterator[Any]:
+        """Источник для фонового потока: соединение создаётся лениво, курсор закрывается с генератором."""
+        if self._phx is None:
+            self._phx = self._phx_factory()
+        yield from self._phx.fetch_increment_adaptive(table, ts_col, columns, s_q, e_q)
+
+    def start(self, table: str, ts_col: str, columns: Sequence[str], s_q: datetime, e_q: datetime) -> None:
+        """Запускает фоновое чтение окна [s_q; e_q); предыдущая незабранная предвыборка отменяется."""
+        self.cancel()
+        self._key = (s_q, e_q)
+        self._it = _iter_prefetched(
+            self._batches(table, ts_col, columns, s_q, e_q), self._queue_size, "phx-next-slice",
+        )
+
+    def take(self, s_q: datetime, e_q: datetime) -> Optional[Iterator[List[Dict[str, Any]]]]:
+        """Итератор предвыбранных батчей для окна [s_q; e_q) или None (нет/не то окно)."""
+        if self._it is None or self._key != (s_q, e_q):
+            self.cancel()
+            return None
+        it, self._key, self._it = self._it, None, None
+        return it
+
+    def cancel(self) -> None:
+        """Отменяет незабранную предвыборку (поток завершится на ближайшем батче)."""
+        it, self._key, self._it = self._it, None, None
+        if it is not None:
+            it.close()
+
+    def close(self) -> None:
+        """Отменяет предвыборку и закрывает собственное Phoenix-соединение."""
+        self.cancel()
+        phx, self._phx = self._phx, None
+        close = getattr(phx, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+
+
 def process_one_slice(
     *,
     cfg: Any,
@@ -367,6 +812,8 @@ def process_one_slice(
     maybe_hb: Optional[Callable[[int, int], None]] = None,
     new_rows_since_pub_by_part: Optional[Dict[int, int]] = None,
     pending_parts: Optional[Set[int]] = None,
+    batches: Optional[Iterable[Sequence[Dict[str, Any]]]] = None,
+    insert_columns: Optional[Callable[[str, Tuple[str, ...], List[List[Any]]], int]] = None,
 ) -> Tuple[int, int]:
     """
     Совместимый с оркестратором адаптер:
@@ -375,6 +822,13 @@ def process_one_slice(
     - пишет в RAW через переданный колбэк insert_rows (клиент CH скрыт в вызывающей стороне),
     - обновляет pending_parts и счётчики new_rows_since_pub_by_part.
 
+    При ETL_PIPELINE_QUEUE > 0 чтение Phoenix, конвертация и вставки в CH идут тремя стадиями
+    (см. _iter_prefetched и _run_pipelined); при 0 — последовательно, как раньше.
+    batches — уже открытый поток батчей этого окна (например, от SlicePrefetcher);
+    если не задан, читаем Phoenix сами.
+    При CH_INSERT_COLUMNAR=1 (по умолчанию) и заданном insert_columns данные копятся по колонкам
+    (SoA) и уходят в CH колоночной вставкой, без кортежа на каждую строку.
+
     Возвращает (rows_read, rows_written) за слайс.
     """
     table, ts_col, columns = phx_meta
@@ -384,44 +838,68 @@ def process_one_slice(
     if pending_parts is None:
         pending_parts = set()
 
-    rows_read = 0
+    counters = [0]  # rows_read (обновляется генератором чанков)
     rows_written = 0
-    buf: List[tuple] = []
-
-    # Локальные ссылки
-    fetch_iter = phx.fetch_increment_adaptive
-    append = buf.append
-    add_part = pending_parts.add
-    get_count = new_rows_since_pub_by_part.get
-    set_count = new_rows_since_pub_by_part.__setitem__
     columns_ch: Tuple[str, ...] = tuple(CH_COLUMNS)
 
-    for batch in fetch_iter(table, ts_col, columns, s_q, e_q):
-        if not batch:
-            continue
 
-        for r in batch:
-            append(row_to_tuple(r))
-            p = opd_to_part(r.get("opd"))
-            if p is not None:
-                add_part(p)
-                set_count(p, (get_count(p, 0) + 1))
+    # Колоночный путь строит колонки по _COLUMN_PLAN — пользовательский row_to_tuple он бы обошёл,
+    # поэтому с нестандартным конвертером остаёмся на кортежах
+    columnar = (
+        insert_columns is not None
+        and row_to_tuple is _row_to_ch_tuple
+        and bool(getattr(cfg, "CH_INSERT_COLUMNAR", True))
+    )
+    insert_chunk: Callable[[str, Any, Tuple[str, ...]], int]
+    if columnar:
+        insert_chunk = lambda t, data, c: insert_columns(t, c, data)  # noqa: E731
+    else:
+        insert_chunk = insert_rows
 
-        rows_read += len(batch)
+    try:
+        queue_size = int(getattr(cfg, "ETL_PIPELINE_QUEUE", 0) or 0)
+    except Exception:
+        queue_size = 0
+
+    if batches is None:
+        batches = phx.fetch_increment_adaptive(table, ts_col, columns, s_q, e_q)
+        if queue_size > 0:
+            # Три стадии: чтение Phoenix (свой поток) → конвертация (поток конвейера) → вставка в CH.
+            # Батчи от SlicePrefetcher уже читаются в своём потоке — их не оборачиваем.
+            batches = _iter_prefetched(batches, queue_size)
+
+    chunks = _iter_ch_chunks(
+        batches,
+        ch_batch, row_to_tuple, opd_to_part,
+        pending_parts, new_rows_since_pub_by_part, counters,
+        columnar=columnar,
+        # Без конвейера чанк вставляется до следующего next() — буфер можно переиспользовать
+        reuse_buffer=queue_size <= 0,
+    )
 
-        if len(buf) >= ch_batch:
-            rows_written += int(insert_rows(ch_table_raw_all, buf, columns_ch))
-            buf.clear()
-            if maybe_hb:
-                maybe_hb(rows_read, rows_written)
+    presort = bool(getattr(cfg, "CH_INSERT_PRESORT", False))
 
-    if buf:
-        rows_written += int(insert_rows(ch_table_raw_all, buf, columns_ch))
-        buf.clear()
+    def _consume(chunk: List[Any]) -> None:
+        nonlocal rows_written
+        if presort:
+            _presort_chunk(chunk, columnar)
+        rows_written += int(insert_chunk(ch_table_raw_all, chunk, columns_ch))
         if maybe_hb:
-            maybe_hb(rows_read, rows_written)
+            maybe_hb(counters[0], rows_written)
+
+    try:
+        if queue_size > 0:
+            _run_pipelined(chunks, _consume, queue_size)
+        else:
+            for chunk in chunks:
+                _consume(chunk)
+    finally:
+        # При ошибке останавливаем фоновое чтение и закрываем курсор Phoenix (после полного чтения — no-op)
+        close = getattr(batches, "close", None)
+        if callable(close):
+            close()
 
-    return rows_read, rows_written
+    return counters[0], rows_written
 
 
 # -----------------------------------------------------------------------------
@@ -435,18 +913,25 @@ opd_to_part_utc = _opd_to_part_utc
 __all__ = [
     # публичные имена
     "process_one_slice",
+    "SlicePrefetcher",
     "row_to_ch_tuple",
     "opd_to_part_utc",
     "resolve_phx_table_and_cols",
     # приватные (для обратной совместимости и прямых вызовов)
     "_row_to_ch_tuple",
+    "_rows_to_ch_tuples",
+    "_rows_to_ch_columns",
     "_flush_ch_buffer",
     "_proc_phx_batch",
     "_process_one_slice",
     "_opd_to_part_utc",
+    "_as_int",
+    "_to_utc_naive",
     "_parse_ch_storage",
+    "_parse_ch_array",
     # константы схемы
     "CH_COLUMNS",
     "CH_DT_FIELDS",
     "CH_INT_FIELDS",
+    "CH_ARRAY_FIELD",
 ]
\ No newline at end of file
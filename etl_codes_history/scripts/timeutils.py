@@ -11,6 +11,7 @@
 - get_tz
 - iter_partitions_by_day_tz
 - parse_cli_dt
+- compute_phx_slice_and_log
 
 Дизайн:
 - Все функции «чистые» и без побочных эффектов (кроме кэша get_tz).
@@ -22,7 +23,8 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timedelta, timezone
+import logging
+from datetime import date, datetime, timedelta, timezone
 from functools import lru_cache
 from typing import Any, Iterable, Iterator, Optional, Tuple
 from zoneinfo import ZoneInfo
@@ -138,11 +140,79 @@ def iter_partitions_by_day_tz(start_dt: datetime, end_dt: datetime, tz_name: str
 
     s_loc = _as_tz(start_dt)
     e_loc = _as_tz(end_dt - timedelta(milliseconds=1))
-    d = s_loc.date()
-    last = e_loc.date()
-    while d <= last:
-        yield d.year * 10000 + d.month * 100 + d.day
-        d += timedelta(days=1)
+    yield from _day_parts(s_loc.date().toordinal(), e_loc.date().toordinal())
+
+
+@lru_cache(maxsize=256)
+def _day_parts(first_ord: int, last_ord: int) -> Tuple[int, ...]:
+    """
+    Предвычисленный набор партиций YYYYMMDD для дней [first_ord; last_ord] (ординалы date).
+    Слайсы одного окна многократно попадают в одни и те же дни — кэш убирает повторную
+    арифметику дат; итоговый tuple удобно отдавать в set.update одним вызовом.
+    """
+    out = []
+    for o in range(first_ord, last_ord + 1):
+        d = date.fromordinal(o)
+        out.append(d.year * 10000 + d.month * 100 + d.day)
+    return tuple(out)
+
+
+# -------------------- Окно Phoenix для слайса --------------------
+
+_log = logging.getLogger("codes_history_increment")
+
+
+def _to_naive_utc(dt: datetime) -> datetime:
+    """Naive → как есть (уже UTC); aware → UTC без tzinfo. Быстрый выход без replace/astimezone."""
+    tz = dt.tzinfo
+    if tz is None:
+        return dt
+    if tz is timezone.utc:
+        return dt.replace(tzinfo=None)
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _log_tz_context(s: datetime, business_tz_name: str) -> None:
+    """Разовый лог TZ-контекста запуска: зона и её смещение (берётся по первому слайсу)."""
+    try:
+        if not business_tz_name:
+            _log.info("TZ-контекст: BUSINESS_TZ не задана — границы слайсов трактуются в UTC.")
+            return
+        tz = get_tz(business_tz_name)
+        s_aware = s if s.tzinfo is not None else s.replace(tzinfo=timezone.utc)
+        off = s_aware.astimezone(tz).utcoffset() or timedelta(0)
+        off_min = int(off.total_seconds()) // 60
+        sign = "+" if off_min >= 0 else "-"
+        hh, mm = divmod(abs(off_min), 60)
+        _log.info("TZ-контекст: BUSINESS_TZ=%s (UTC%s%02d:%02d); запросы в Phoenix — в naive UTC.",
+                  business_tz_name, sign, hh, mm)
+    except Exception:
+        # Лог контекста — best effort, на расчёт окна не влияет
+        pass
+
+
+def compute_phx_slice_and_log(
+    s: datetime,
+    e: datetime,
+    is_first_slice: bool,
+    overlap_delta: timedelta,
+    business_tz_name: str,
+    logged_tz_context: bool,
+) -> Tuple[datetime, datetime, bool]:
+    """
+    Окно запроса в Phoenix для бизнес-слайса [s; e):
+    • на первом слайсе левая граница сдвигается на overlap_delta («захлёст»), далее — ровно [s; e);
+    • границы — naive UTC (как ожидает Phoenix);
+    • TZ-контекст логируется один раз за запуск: зона/смещение считаются только при
+      logged_tz_context=False, поэтому на остальных слайсах никаких TZ-вычислений нет.
+    Возвращает (s_q, e_q, logged_tz_context).
+    """
+    s_q = _to_naive_utc(s - overlap_delta if (is_first_slice and overlap_delta) else s)
+    e_q = _to_naive_utc(e)
+    if not logged_tz_context:
+        _log_tz_context(s, business_tz_name)
+        logged_tz_context = True
+    return s_q, e_q, logged_tz_context
 
 
 def parse_cli_dt(value: Optional[str], mode: str, business_tz_name: str) -> Optional[datetime]:
@@ -183,4 +253,5 @@ __all__ = [
     "get_tz",
     "iter_partitions_by_day_tz",
     "parse_cli_dt",
+    "compute_phx_slice_and_log",
 ]
\ No newline at end of file
@@ -0,0 +1,61 @@
+# file: tests/test_config_env.py
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from scripts.config import _ENV_LINE_RE, _load_env_try_fallback
+
+
+def _parse(line):
+    """Повторяет разбор _load_env_try_fallback: (ключ, значение) или None."""
+    m = _ENV_LINE_RE.match(line)
+    if m is None:
+        return None
+    k, dq, sq, raw = m.groups()
+    return k, dq if dq is not None else sq if sq is not None else raw
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("A=1", ("A", "1")),
+        ("export A=1", ("A", "1")),
+        ("  A = x y  ", ("A", "x y")),
+        ("A=", ("A", "")),
+        ("A=a #comment", ("A", "a")),
+        ("A=a#b", ("A", "a#b")),
+        ('A="q # x" # c', ("A", "q # x")),
+        ("A='single # quoted'", ("A", "single # quoted")),
+        ('A="', ("A", '"')),
+        ('A={"m": 4}', ("A", '{"m": 4}')),
+        ("A=postgresql://u:p@h:5432/db?sslmode=disable", ("A", "postgresql://u:p@h:5432/db?sslmode=disable")),
+    ],
+)
+def test_env_line_values(line, expected):
+    assert _parse(line) == expected
+
+
+@pytest.mark.parametrize("line", ["", "   ", "# A=1", "  # comment", "1A=x", "A B=1", "just text"])
+def test_env_line_ignored(line):
+    assert _parse(line) is None
+
+
+def test_fallback_loader_keeps_existing_env(tmp_path, monkeypatch):
+    for k in ("ETL_T_NEW", "ETL_T_QUOTED", "ETL_T_KEEP"):
+        monkeypatch.setenv(k, "x")
+        monkeypatch.delenv(k)
+    monkeypatch.setenv("ETL_T_KEEP", "from-env")
+    env = tmp_path / ".env"
+    env.write_text(
+        "# comment\n"
+        "ETL_T_NEW=42 # inline\n"
+        "export ETL_T_QUOTED=\"a # b\"\n"
+        "ETL_T_KEEP=from-file\n",
+        encoding="utf-8",
+    )
+
+    assert _load_env_try_fallback([tmp_path / "missing.env", env]) == str(env)
+    assert os.environ["ETL_T_NEW"] == "42"
+    assert os.environ["ETL_T_QUOTED"] == "a # b"
+    assert os.environ["ETL_T_KEEP"] == "from-env"
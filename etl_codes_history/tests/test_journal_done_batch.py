@@ -0,0 +1,219 @@
+# file: tests/test_journal_done_batch.py
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from scripts.journal import DoneBuffer, ProcessJournal, UniqueViolation
+
+TABLE = "public.inc_processing"
+STATE_TABLE = "public.inc_process_state"
+
+
+class FakeJournalPG:
+    """
+    In-memory журнал: понимает ровно те SQL, что шлёт ProcessJournal на пути
+    planned → running → ok, и держит инвариант частичного UNIQUE индекса
+    (не больше одной записи planned|running с ts_end IS NULL на процесс).
+    fail_state=True — UPSERT состояния падает; внутри pipeline() ошибка всплывает
+    только на выходе из блока (sync), как в psycopg3.
+    """
+
+    def __init__(self) -> None:
+        self.rows = {}
+        self.next_id = 1
+        self.state = {}
+        self.state_upserts = 0
+        self.fail_state = False
+        self.fail_commit = False
+        self._in_pipeline = False
+        self._pipeline_error = None
+        self._result = []
+
+    @contextmanager
+    def pipeline(self):
+        self._in_pipeline = True
+        try:
+            yield
+        finally:
+            self._in_pipeline = False
+        err, self._pipeline_error = self._pipeline_error, None
+        if err is not None:
+            raise err
+
+    # ---- модель ----
+    def _active(self):
+        return [r for r in self.rows.values() if r["ts_end"] is None and r["status"] in ("planned", "running")]
+
+    def _window(self, status, sf, st):
+        for rid in sorted(self.rows, reverse=True):
+            r = self.rows[rid]
+            if (r["status"] == status and r["ts_end"] is None
+                    and r["details"].get("slice_from") == sf and r["details"].get("slice_to") == st):
+                return rid
+        return None
+
+    def _insert(self, status, details):
+        if self._active():
+            raise UniqueViolation("duplicate key value violates unique constraint (one active row)")
+        rid = self.next_id
+        self.next_id += 1
+        self.rows[rid] = {"status": status, "ts_end": None, "details": dict(details)}
+        return rid
+
+    def _close(self, rid, status, metrics=None):
+        r = self.rows[rid]
+        r["status"], r["ts_end"] = status, "now"
+        r["details"].update(metrics or {})
+
+    # ---- протокол PG-клиента ----
+    def execute(self, sql, params=()):
+        q = " ".join(sql.split())
+        self._result = []
+        if q.startswith(f"INSERT INTO {TABLE} "):
+            status = "planned" if "'planned'" in q else "running"
+            self._result = [(self._insert(status, params[1]),)]
+        elif q.startswith(f"INSERT INTO {STATE_TABLE} "):
+            if self.fail_state:
+                err = RuntimeError("state upsert failed")
+                if not self._in_pipeline:
+                    raise err
+                self._pipeline_error = err
+                return
+            self.state_upserts += 1
+            if params[3] is not None:
+                self.state["last_ok_end"] = params[3]
+        elif "SET status='running'" in q:
+            _, sf, st, upd = params
+            rid = self._window("planned", sf, st)
+            if rid is not None:
+                self.rows[rid]["status"] = "running"
+                self.rows[rid]["details"].update(upd)
+                self._result = [(rid,)]
+        elif "SET status='ok'" in q:
+            if len(params) == 4:
+                rid = self._window("running", params[1], params[2])
+                metrics = params[3]
+            else:
+                act = [i for i, r in self.rows.items() if r["ts_end"] is None and r["status"] == "running"]
+                rid = max(act) if act else None
+                metrics = params[1]
+            if rid is not None:
+                self._close(rid, "ok", metrics)
+                self._result = [(rid,)]
+        elif "SET status='skipped'" in q or "SET status='error'" in q:
+            status = "skipped" if "'skipped'" in q else "error"
+            rid = self._window("planned" if status == "skipped" else "running", params[1], params[2])
+            if rid is not None:
+                self._close(rid, status)
+        elif q.startswith(f"SELECT id FROM {TABLE} "):
+            if "status IN ('planned','running')" in q:
+                act = sorted(i for i, r in self.rows.items() if r in self._active())
+                self._result = [(act[-1],)] if act else []
+            else:
+                rid = self._window("running", params[1], params[2])
+                self._result = [(rid,)] if rid is not None else []
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return list(self._result)
+
+    def commit(self):
+        if self.fail_commit:
+            raise RuntimeError("commit failed")
+
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+STEP = timedelta(minutes=60)
+
+
+def _run_slices(journal, done, n):
+    """Последовательность оркестратора: planned → running → mark_done на каждый слайс."""
+    for i in range(n):
+        s, e = T0 + i * STEP, T0 + (i + 1) * STEP
+        journal.mark_planned(s, e)
+        journal.mark_running(s, e, host="h", pid=1)
+        done(s, e, rows_read=10, rows_written=10 * (i + 1))
+
+
+def test_fake_enforces_single_active_row():
+    pg = FakeJournalPG()
+    journal = ProcessJournal(pg, TABLE, "p")
+    journal.mark_planned(T0, T0 + STEP)
+    journal.mark_running(T0, T0 + STEP)
+    # Предыдущий слайс не закрыт — новая активная строка нарушает индекс
+    with pytest.raises(UniqueViolation):
+        journal.mark_running(T0 + STEP, T0 + 2 * STEP)
+
+
+def test_done_buffer_two_slices_closes_rows_and_defers_watermark():
+    pg = FakeJournalPG()
+    journal = ProcessJournal(pg, TABLE, "p")
+    done = DoneBuffer(journal, 3)
+
+    _run_slices(journal, done, 2)
+
+    assert [r["status"] for r in pg.rows.values()] == ["ok", "ok"]
+    assert not pg._active()
+    assert "last_ok_end" not in pg.state
+
+    done.flush()
+    assert pg.state["last_ok_end"] == (T0 + 2 * STEP).isoformat()
+    upserts = pg.state_upserts
+    done.flush()
+    assert pg.state_upserts == upserts
+
+
+def test_done_buffer_flushes_watermark_every_size_slices():
+    pg = FakeJournalPG()
+    journal = ProcessJournal(pg, TABLE, "p")
+    done = DoneBuffer(journal, 2)
+
+    _run_slices(journal, done, 3)
+
+    assert [r["status"] for r in pg.rows.values()] == ["ok", "ok", "ok"]
+    assert pg.state["last_ok_end"] == (T0 + 2 * STEP).isoformat()
+    done.flush()
+    assert pg.state["last_ok_end"] == (T0 + 3 * STEP).isoformat()
+
+
+def test_failed_state_upsert_does_not_advance_watermark_cache():
+    pg = FakeJournalPG()
+    journal = ProcessJournal(pg, TABLE, "p")
+    _run_slices(journal, journal.mark_done, 1)
+    assert journal.get_watermark() == T0 + STEP
+
+    pg.fail_state = True
+    s, e = T0 + STEP, T0 + 2 * STEP
+    journal.mark_planned(s, e)
+    journal.mark_running(s, e)
+    journal.mark_done(s, e, rows_read=1, rows_written=1)
+
+    assert pg.rows[2]["status"] == "ok"
+    assert pg.state["last_ok_end"] == (T0 + STEP).isoformat()
+    assert journal.get_watermark() == T0 + STEP
+
+
+def test_failed_commit_does_not_advance_watermark_cache():
+    pg = FakeJournalPG()
+    journal = ProcessJournal(pg, TABLE, "p")
+    _run_slices(journal, journal.mark_done, 1)
+    assert journal.get_watermark() == T0 + STEP
+
+    pg.fail_commit = True
+    s, e = T0 + STEP, T0 + 2 * STEP
+    journal.mark_planned(s, e)
+    journal.mark_running(s, e)
+    journal.mark_done(s, e, rows_read=1, rows_written=1)
+    assert journal.get_watermark() == T0 + STEP
+
+    with pytest.raises(RuntimeError, match="commit failed"):
+        journal._state_upsert(status="ok", healthy=True, last_ok_end=T0 + 3 * STEP, commit=True)
+    assert journal.get_watermark() == T0 + STEP
+
+    pg.fail_commit = False
+    journal.mark_state_ok(T0 + 2 * STEP)
+    assert journal.get_watermark() == T0 + 2 * STEP
@@ -0,0 +1,297 @@
+# file: tests/test_orchestrator.py
+# -*- coding: utf-8 -*-
+import importlib
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+SINCE = datetime(2024, 1, 1, 22, tzinfo=timezone.utc)
+UNTIL = datetime(2024, 1, 2, 1, tzinfo=timezone.utc)  # 3 часовых слайса, две партиции
+
+
+def _driver_modules():
+    """Минимальные модули драйверов: оркестратор импортирует их на уровне модуля, сеть тесту не нужна."""
+    psycopg = types.ModuleType("psycopg")
+    psycopg.OperationalError = type("OperationalError", (Exception,), {})
+    ch_driver = types.ModuleType("clickhouse_driver")
+    ch_driver.Client = object
+    ch_driver.errors = types.SimpleNamespace(
+        UnexpectedPacketFromServerError=type("UnexpectedPacketFromServerError", (Exception,), {}),
+    )
+    return {"psycopg": psycopg, "clickhouse_driver": ch_driver}
+
+
+@pytest.fixture(scope="module")
+def etl():
+    with pytest.MonkeyPatch.context() as mp:
+        for name, mod in _driver_modules().items():
+            if name not in sys.modules:
+                try:
+                    importlib.import_module(name)
+                except ImportError:
+                    mp.setitem(sys.modules, name, mod)
+        yield importlib.import_module("scripts.codes_history_etl")
+
+
+class FakeJournal:
+    """Журнал в памяти: держит инвариант «одна активная запись» и пишет вызовы в calls."""
+
+    def __init__(self):
+        self.calls = []
+        self.active = None
+        self.watermark = None
+
+    @contextmanager
+    def exclusive_lock(self):
+        yield True
+
+    def sanitize_stale(self, **kw):
+        pass
+
+    def clear_conflicting_planned(self, s, e):
+        pass
+
+    def mark_planned(self, s, e):
+        assert self.active is None, "вторая активная запись в журнале"
+        self.active = (s, e)
+        return 1
+
+    def mark_running(self, s, e, host=None, pid=None):
+        assert self.active == (s, e)
+        return 1
+
+    def heartbeat(self, run_id, progress=None):
+        pass
+
+    def mark_done(self, s, e, rows_read=None, rows_written=None, update_state=True):
+        assert self.active == (s, e)
+        self.active = None
+        self.calls.append(("done", s, e))
+        if update_state:
+            self.watermark = e
+        return 1
+
+    def mark_state_ok(self, slice_to, rows_read=None, rows_written=None):
+        self.calls.append(("state", slice_to))
+        self.watermark = slice_to
+
+    def mark_error(self, s, e, message="", **kw):
+        self.active = None
+        self.calls.append(("error", s, e))
+
+    def mark_cancelled(self, s, e, message=""):
+        self.active = None
+        self.calls.append(("cancelled", s, e))
+
+
+class FakePG:
+    def execute(self, sql, params=()):
+        pass
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def clone(self):
+        return FakePG()
+
+
+class FakeCH:
+    """
+    CH в памяти: строки вставок и журнал SQL (с потоком-исполнителем) общие для клонов.
+    REPLACE партиций из fail_parts падает; delay — задержка REPLACE; clone_kw — параметры клонов.
+    """
+
+    def __init__(self, shared=None, fail_parts=(), delay=0.0, clone_kw=None):
+        self.shared = shared if shared is not None else SimpleNamespace(rows=[], sql=[], lock=threading.Lock())
+        self.fail_parts = set(fail_parts)
+        self.delay = delay
+        self.clone_kw = clone_kw or {}
+
+    def insert_rows(self, table, rows, columns):
+        with self.shared.lock:
+            self.shared.rows.extend(rows)
+        return len(rows)
+
+    def insert_columns(self, table, columns, data):
+        with self.shared.lock:
+            self.shared.rows.extend(zip(*data))
+        return len(data[0])
+
+    def execute(self, sql, params=None, settings=None):
+        if "REPLACE PARTITION" in sql:
+            time.sleep(self.delay)
+            if any(f"PARTITION {p} " in sql for p in self.fail_parts):
+                raise RuntimeError("replace failed")
+        with self.shared.lock:
+            self.shared.sql.append((threading.current_thread() is threading.main_thread(), sql))
+        return []
+
+    def replaced(self):
+        """[(в главном потоке?, партиция)] успешных REPLACE в порядке выполнения."""
+        return [(main, int(s.split("PARTITION ")[1].split()[0])) for main, s in self.shared.sql if "REPLACE PARTITION" in s]
+
+    def clone(self):
+        return FakeCH(self.shared, **self.clone_kw)
+
+    def close(self):
+        pass
+
+
+class FakePhx:
+    """Phoenix в памяти: по две строки на каждый час окна; windows — запрошенные окна, у клонов свой список."""
+
+    def __init__(self, fail_from=None):
+        self.windows = []
+        self.clones = []
+        self.fail_from = fail_from
+
+    def fetch_increment_adaptive(self, table, ts_col, columns, s_q, e_q):
+        self.windows.append((s_q, e_q))
+        if self.fail_from is not None and s_q >= self.fail_from:
+            raise ConnectionError("phoenix down")
+        yield [{"c": f"{s_q:%d%H}-{i}", "t": 1, "opd": s_q + timedelta(minutes=i)} for i in range(2)]
+
+    def clone(self):
+        self.clones.append(FakePhx(self.fail_from))
+        return self.clones[-1]
+
+    def close(self):
+        pass
+
+
+def _cfg(**kw):
+    base = dict(
+        CH_RAW_TABLE="stg.raw_all",
+        CH_CLEAN_TABLE="stg.clean",
+        CH_DEDUP_BUF_TABLE="stg.buf",
+        JOURNAL_TABLE="public.inc_processing",
+        CH_CLUSTER="",
+        CH_INSERT_BATCH=100,
+        CH_INSERT_COLUMNAR=True,
+        CH_INSERT_PRESORT=False,
+        CH_PUBLISH_BUF_TRUNCATE=False,
+        CH_PUBLISH_DEDUP_MODE="argmax",
+        CH_PUBLISH_AGG_IN_ORDER=True,
+        CH_DEDUP_SETTINGS_JSON="",
+        PUBLISH_PARALLELISM=1,
+        ETL_PIPELINE_QUEUE=0,
+        JOURNAL_DONE_BATCH=1,
+        PUBLISH_IN_BACKGROUND=False,
+        PHX_PREFETCH_NEXT_SLICE=False,
+        STARTUP_BACKFILL_DAYS=0,
+    )
+    base.update(kw)
+    return SimpleNamespace(**base)
+
+
+def _params(etl, *, cfg=None, journal=None, ch=None, phx=None, **kw):
+    base = dict(
+        journal=journal or FakeJournal(),
+        cfg=cfg or _cfg(),
+        ch=ch or FakeCH(),
+        phx=phx or FakePhx(),
+        pg=FakePG(),
+        process_name="p",
+        host="h",
+        pid=1,
+        since_dt=SINCE,
+        until_dt=UNTIL,
+        step_min=60,
+        business_tz_name="UTC",
+        overlap_delta=timedelta(0),
+        publish_every_slices=0,
+        publish_only_if_new=False,
+        publish_min_new_rows=1,
+        always_publish_at_end=True,
+        backfill_missing_enabled=False,
+        phx_table="T",
+        phx_ts_col="ts",
+        phx_cols=("c", "t", "opd"),
+    )
+    base.update(kw)
+    return etl.ExecParams(**base)
+
+
+def test_execute_with_lock_smoke(etl):
+    journal, ch = FakeJournal(), FakeCH()
+    assert etl._execute_with_lock(_params(etl, journal=journal, ch=ch)) == (6, 6)
+
+    assert len(ch.shared.rows) == 6
+    assert [c[0] for c in journal.calls] == ["done"] * 3
+    assert journal.watermark == UNTIL and journal.active is None
+    assert sorted(p for _, p in ch.replaced()) == [20240101, 20240102]
+
+
+def _naive(dt):
+    return dt.replace(tzinfo=None)
+
+
+def test_background_publications_drain_before_final(etl):
+    # Фоновый REPLACE медленный: без ожидания финальная публикация в главном потоке обогнала бы его
+    ch = FakeCH(clone_kw={"delay": 0.2})
+    cfg = _cfg(PUBLISH_IN_BACKGROUND=True)
+    etl._execute_with_lock(_params(etl, cfg=cfg, ch=ch, publish_every_slices=2))
+
+    assert ch.replaced() == [(False, 20240101), (True, 20240102)]
+
+
+def test_failed_background_parts_are_requeued_for_final(etl):
+    ch = FakeCH(clone_kw={"fail_parts": {20240101}})
+    cfg = _cfg(PUBLISH_IN_BACKGROUND=True)
+    etl._execute_with_lock(_params(etl, cfg=cfg, ch=ch, publish_every_slices=1))
+
+    # В фоне 20240101 не опубликовалась ни разу — её дожимает финальная публикация в главном потоке
+    assert (False, 20240101) not in ch.replaced()
+    assert (True, 20240101) in ch.replaced()
+    assert (False, 20240102) in ch.replaced()
+
+
+def test_prefetch_window_mismatch_falls_back_to_direct_read(etl, monkeypatch):
+    real = etl.compute_phx_slice_and_log
+    calls = []
+
+    def skewed(s, e, *args):
+        calls.append(s)
+        s_q, e_q, logged = real(s, e, *args)
+        # 2-й вызов — старт предвыборки второго слайса: сдвигаем окно, take() его не примет
+        return (s_q, e_q + timedelta(minutes=1), logged) if len(calls) == 2 else (s_q, e_q, logged)
+
+    monkeypatch.setattr(etl, "compute_phx_slice_and_log", skewed)
+    phx, ch = FakePhx(), FakeCH()
+    cfg = _cfg(PHX_PREFETCH_NEXT_SLICE=True)
+    assert etl._execute_with_lock(_params(etl, cfg=cfg, ch=ch, phx=phx)) == (6, 6)
+
+    h = timedelta(hours=1)
+    s1, s2, s3 = _naive(SINCE), _naive(SINCE) + h, _naive(SINCE) + 2 * h
+    assert phx.windows == [(s1, s2), (s2, s3)]  # первый слайс и слайс с несовпавшей предвыборкой
+    assert len(phx.clones) == 1
+    assert phx.clones[0].windows[-1] == (s3, s3 + h)  # третий слайс взят из предвыборки
+    assert len(ch.shared.rows) == 6
+    assert not [t for t in threading.enumerate() if t.name.startswith("phx-")]
+
+
+def test_done_buffer_flushed_when_slice_fails(etl):
+    journal = FakeJournal()
+    third = _naive(SINCE) + timedelta(hours=2)
+    cfg = _cfg(JOURNAL_DONE_BATCH=5)
+    with pytest.raises(ConnectionError, match="phoenix down"):
+        etl._execute_with_lock(_params(etl, cfg=cfg, journal=journal, phx=FakePhx(fail_from=third)))
+
+    second_end = SINCE + timedelta(hours=2)
+    assert [c[0] for c in journal.calls] == ["done", "done", "error", "state"]
+    assert journal.watermark == second_end and journal.active is None
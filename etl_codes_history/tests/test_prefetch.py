@@ -0,0 +1,58 @@
+# file: tests/test_prefetch.py
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from scripts.db.prefetch import PrefetchIterator
+
+
+def test_merges_sources_keeping_order_within_source():
+    it = PrefetchIterator([range(0, 50), range(100, 150)], 4, "t")
+    items = list(it)
+    assert sorted(items) == list(range(0, 50)) + list(range(100, 150))
+    assert [x for x in items if x < 100] == list(range(0, 50))
+
+
+def test_source_error_reaches_consumer():
+    def bad():
+        yield 1
+        raise ValueError("boom")
+
+    it = PrefetchIterator([bad()], 2)
+    with pytest.raises(ValueError, match="boom"):
+        list(it)
+    assert list(it) == []
+
+
+def test_close_stops_blocked_producer_and_closes_source():
+    closed = threading.Event()
+
+    def endless():
+        try:
+            n = 0
+            while True:
+                yield n
+                n += 1
+        finally:
+            closed.set()
+
+    it = PrefetchIterator([endless()], 1)
+    assert next(it) == 0
+    it.close()
+    assert closed.is_set()
+    assert not any(t.is_alive() for t in it._threads)
+
+
+def test_close_before_iteration():
+    closed = threading.Event()
+
+    def src():
+        try:
+            yield from range(10)
+        finally:
+            closed.set()
+
+    with PrefetchIterator([src()], 1):
+        pass
+    assert closed.is_set()
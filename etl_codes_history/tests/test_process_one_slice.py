@@ -0,0 +1,126 @@
+# file: tests/test_process_one_slice.py
+# -*- coding: utf-8 -*-
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from scripts.slices import SlicePrefetcher, _parse_ch_array, process_one_slice
+
+S_Q, E_Q = datetime(2024, 1, 1), datetime(2024, 1, 3)
+ROWS = [{"c": f"C{i}", "t": i % 3, "opd": datetime(2024, 1, 1 + i % 2, 5)} for i in range(7)]
+
+
+class FakePhx:
+    """Phoenix без сети: отдаёт ROWS батчами по 3; fail_after — ошибка после N батчей."""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.closed = threading.Event()
+
+    def fetch_increment_adaptive(self, table, ts_col, columns, s_q, e_q):
+        try:
+            for n, i in enumerate(range(0, len(ROWS), 3)):
+                if self.fail_after is not None and n >= self.fail_after:
+                    raise ConnectionError("phoenix down")
+                yield [dict(r) for r in ROWS[i:i + 3]]
+        finally:
+            self.closed.set()
+
+
+class FakeCH:
+    """Копит вставленные значения колонки c; fail_on — ошибка на N-й вставке."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.calls = 0
+        self.c_values = []
+
+    def _check(self):
+        self.calls += 1
+        if self.fail_on is not None and self.calls >= self.fail_on:
+            raise RuntimeError("ch insert failed")
+
+    def insert_rows(self, table, rows, columns):
+        self._check()
+        self.c_values.extend(r[0] for r in rows)
+        return len(rows)
+
+    def insert_columns(self, table, columns, data):
+        self._check()
+        self.c_values.extend(data[0])
+        return len(data[0])
+
+
+def _run(queue, *, phx=None, ch=None, columnar=True, batches=None):
+    phx = phx or FakePhx()
+    ch = ch or FakeCH()
+    pending, new_rows = set(), {}
+    result = process_one_slice(
+        cfg=SimpleNamespace(ETL_PIPELINE_QUEUE=queue, CH_INSERT_COLUMNAR=columnar, CH_INSERT_PRESORT=False),
+        phx=phx,
+        ch_table_raw_all="stg.raw_all",
+        ch_batch=2,
+        s_q=S_Q,
+        e_q=E_Q,
+        phx_meta=("T", "ts", ("c", "t", "opd")),
+        insert_rows=ch.insert_rows,
+        new_rows_since_pub_by_part=new_rows,
+        pending_parts=pending,
+        batches=batches,
+        insert_columns=ch.insert_columns,
+    )
+    return result, ch, pending, new_rows
+
+
+def _no_worker_threads():
+    return not [t for t in threading.enumerate() if t.name.startswith("phx-")]
+
+
+@pytest.mark.parametrize("queue", [0, 3])
+@pytest.mark.parametrize("columnar", [True, False])
+def test_all_rows_written(queue, columnar):
+    (rows_read, rows_written), ch, pending, new_rows = _run(queue, columnar=columnar)
+    assert (rows_read, rows_written) == (7, 7)
+    assert sorted(ch.c_values) == sorted(r["c"] for r in ROWS)
+    assert pending == {20240101, 20240102}
+    assert new_rows == {20240101: 4, 20240102: 3}
+    assert _no_worker_threads()
+
+
+@pytest.mark.parametrize("queue", [0, 3])
+def test_fetch_error_propagates(queue):
+    phx = FakePhx(fail_after=1)
+    with pytest.raises(ConnectionError, match="phoenix down"):
+        _run(queue, phx=phx)
+    assert phx.closed.is_set()
+    assert _no_worker_threads()
+
+
+@pytest.mark.parametrize("queue", [0, 3])
+def test_insert_error_propagates_and_stops_reader(queue):
+    phx = FakePhx()
+    with pytest.raises(RuntimeError, match="ch insert failed"):
+        _run(queue, phx=phx, ch=FakeCH(fail_on=1))
+    assert phx.closed.is_set()
+    assert _no_worker_threads()
+
+
+@pytest.mark.parametrize("queue", [0, 3])
+def test_prefetched_batches_are_used(queue):
+    pre = SlicePrefetcher(FakePhx, 2)
+    try:
+        pre.start("T", "ts", ("c", "t", "opd"), S_Q, E_Q)
+        (rows_read, rows_written), ch, _, _ = _run(queue, phx=FakePhx(fail_after=0), batches=pre.take(S_Q, E_Q))
+    finally:
+        pre.close()
+    assert (rows_read, rows_written) == (7, 7)
+    assert _no_worker_threads()
+
+
+def test_parse_ch_array_never_aliases_source_list():
+    src = ["b", "a"]
+    got = _parse_ch_array(src)
+    got.sort()
+    assert got == ["a", "b"] and src == ["b", "a"]
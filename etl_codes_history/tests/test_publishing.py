@@ -0,0 +1,176 @@
+# file: tests/test_publishing.py
+# -*- coding: utf-8 -*-
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from scripts.publishing import (
+    BackgroundPublisher,
+    CH_COLUMNS_STR,
+    DEDUP_SELECT_COLS,
+    _dedup_select_sql,
+    publish_parts,
+    publish_parts_failed,
+)
+
+
+def _cfg(**kw):
+    base = dict(
+        CH_RAW_TABLE="stg.raw_all",
+        CH_CLEAN_TABLE="stg.clean",
+        CH_DEDUP_BUF_TABLE="stg.buf",
+        JOURNAL_TABLE="public.inc_processing",
+        CH_CLUSTER="",
+        CH_PUBLISH_BUF_TRUNCATE=False,
+        PUBLISH_PARALLELISM=1,
+        CH_PUBLISH_DEDUP_MODE="argmax",
+        CH_PUBLISH_AGG_IN_ORDER=True,
+        CH_DEDUP_SETTINGS_JSON="",
+    )
+    base.update(kw)
+    return SimpleNamespace(**base)
+
+
+def test_dedup_sql_argmax_default():
+    head, tail = _dedup_select_sql(_cfg(), "stg.raw_all")
+    assert head == f"SELECT {DEDUP_SELECT_COLS} FROM stg.raw_all "
+    assert tail == "GROUP BY c, opd, t SETTINGS optimize_aggregation_in_order = 1"
+
+
+def test_dedup_sql_argmax_without_agg_in_order():
+    _, tail = _dedup_select_sql(_cfg(CH_PUBLISH_AGG_IN_ORDER=False), "stg.raw_all")
+    assert tail == "GROUP BY c, opd, t"
+
+
+def test_dedup_sql_limit_by():
+    head, tail = _dedup_select_sql(_cfg(CH_PUBLISH_DEDUP_MODE=" LIMIT_BY "), "stg.raw_all")
+    assert head == f"SELECT {CH_COLUMNS_STR} FROM stg.raw_all "
+    assert tail == (
+        "ORDER BY c, opd, t, ingested_at DESC LIMIT 1 BY c, opd, t SETTINGS optimize_read_in_order = 1"
+    )
+
+
+def test_dedup_sql_final():
+    head, tail = _dedup_select_sql(_cfg(CH_PUBLISH_DEDUP_MODE="final"), "stg.raw_all")
+    assert head == f"SELECT {CH_COLUMNS_STR} FROM stg.raw_all FINAL "
+    assert tail == "SETTINGS do_not_merge_across_partitions_select_final = 1"
+
+
+def test_dedup_sql_unknown_mode_falls_back_to_argmax():
+    assert _dedup_select_sql(_cfg(CH_PUBLISH_DEDUP_MODE="bogus"), "r") == _dedup_select_sql(_cfg(), "r")
+
+
+def test_dedup_sql_extra_settings_json_merge_and_override():
+    cfg = _cfg(CH_DEDUP_SETTINGS_JSON='{"max_insert_threads": 8, "optimize_aggregation_in_order": 0, '
+                                      '"use_x": true, "s": "it\'s"}')
+    _, tail = _dedup_select_sql(cfg, "r")
+    assert tail == (
+        "GROUP BY c, opd, t SETTINGS optimize_aggregation_in_order = 0, "
+        "max_insert_threads = 8, use_x = 1, s = 'it\\'s'"
+    )
+
+
+@pytest.mark.parametrize("raw", ["{not json", "[1, 2]", "   "])
+def test_dedup_sql_bad_settings_json_is_ignored(raw):
+    assert _dedup_select_sql(_cfg(CH_DEDUP_SETTINGS_JSON=raw), "r") == _dedup_select_sql(_cfg(), "r")
+
+
+def test_dedup_sql_rejects_non_identifier_setting_names(caplog):
+    cfg = _cfg(CH_DEDUP_SETTINGS_JSON='{"max_threads = 1, readonly": 1, "x-y": 2, "1a": 3, "ok_1": 4}')
+    with caplog.at_level("WARNING", logger="codes_history_increment"):
+        _, tail = _dedup_select_sql(cfg, "r")
+    assert tail == "GROUP BY c, opd, t SETTINGS optimize_aggregation_in_order = 1, ok_1 = 4"
+    assert sum("некорректное имя настройки" in r.getMessage() for r in caplog.records) == 3
+
+
+def test_dedup_sql_all_settings_rejected_gives_no_clause():
+    cfg = _cfg(CH_PUBLISH_AGG_IN_ORDER=False, CH_DEDUP_SETTINGS_JSON='{"a b": 1}')
+    _, tail = _dedup_select_sql(cfg, "r")
+    assert tail == "GROUP BY c, opd, t"
+    assert _dedup_select_sql(_cfg(CH_DEDUP_SETTINGS_JSON="{}"), "r") == _dedup_select_sql(_cfg(), "r")
+
+
+class FakeCH:
+    """Пишет SQL в лог; REPLACE PARTITION для партиций из fail_parts падает."""
+
+    def __init__(self, fail_parts=()):
+        self.fail_parts = set(fail_parts)
+        self.sql = []
+        self.closed = False
+
+    def execute(self, sql):
+        self.sql.append(sql)
+        if "REPLACE PARTITION" in sql and any(f"PARTITION {p} " in sql for p in self.fail_parts):
+            raise RuntimeError("replace failed")
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+class FakePG:
+    """PG-клиент без БД: запоминает потоки, из которых его вызывали."""
+
+    def __init__(self):
+        self.threads = set()
+        self.closed = False
+
+    def execute(self, sql, params=()):
+        self.threads.add(threading.get_ident())
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_publish_parts_failed_reports_only_failed_parts():
+    ch = FakeCH(fail_parts={20240102})
+    failed = publish_parts_failed(ch, _cfg(), FakePG(), "p", {20240101, 20240102, 20240103})
+    assert failed == {20240102}
+    assert publish_parts(FakeCH(fail_parts={20240102}), _cfg(), FakePG(), "p", {20240101, 20240102})
+    assert not publish_parts(FakeCH(fail_parts={20240102}), _cfg(), FakePG(), "p", {20240102})
+
+
+def test_background_publisher_uses_own_pg_and_returns_failed_parts():
+    worker_pgs, worker_chs = [], []
+
+    def ch_factory():
+        worker_chs.append(FakeCH(fail_parts={20240102}))
+        return worker_chs[-1]
+
+    def pg_factory():
+        worker_pgs.append(FakePG())
+        return worker_pgs[-1]
+
+    pub = BackgroundPublisher(ch_factory, _cfg(), pg_factory, "p")
+    try:
+        pub.submit({20240101, 20240102})
+        pub.submit({20240103})
+        assert pub.drain_failed(wait=True) == {20240102}
+    finally:
+        pub.close()
+
+    assert len(worker_pgs) == 1 and len(worker_chs) == 1
+    assert worker_pgs[0].threads and threading.get_ident() not in worker_pgs[0].threads
+    assert worker_pgs[0].closed and worker_chs[0].closed
+
+
+def test_background_publisher_exception_fails_whole_snapshot():
+    def ch_factory():
+        raise RuntimeError("no ch")
+
+    pub = BackgroundPublisher(ch_factory, _cfg(), FakePG, "p")
+    try:
+        pub.submit({20240101, 20240102})
+        assert pub.drain_failed(wait=True) == {20240101, 20240102}
+    finally:
+        pub.close()
@@ -0,0 +1,52 @@
+# file: tests/test_to_utc_naive.py
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from scripts.slices import _to_utc_naive
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (1_704_067_200_123, datetime(2024, 1, 1, 0, 0, 0, 123000)),  # мс
+        (1_704_067_200, datetime(2024, 1, 1)),  # сек
+        (0, datetime(1970, 1, 1)),
+        (-1, datetime(1969, 12, 31, 23, 59, 59)),
+        (1_704_067_200.5, datetime(2024, 1, 1, 0, 0, 0, 500000)),
+        (1_704_067_200_123.0, datetime(2024, 1, 1, 0, 0, 0, 123000)),
+    ],
+)
+def test_epoch_numbers_are_exact_naive_utc(value, expected):
+    got = _to_utc_naive(value)
+    assert got == expected and got.tzinfo is None
+
+
+def test_epoch_ms_matches_aware_conversion_for_wide_range():
+    base = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    for ms in (10**12 + 1, 1_999_999_999_999, 4_102_444_800_001, 253_402_300_799_999):
+        aware = base + timedelta(milliseconds=ms)
+        assert _to_utc_naive(ms) == aware.replace(tzinfo=None)
+
+
+def test_datetime_and_string_paths_truncate_to_ms():
+    assert _to_utc_naive(datetime(2024, 1, 1, 0, 0, 0, 123456)) == datetime(2024, 1, 1, 0, 0, 0, 123000)
+    aware = datetime(2024, 1, 1, 5, 0, tzinfo=timezone(timedelta(hours=5)))
+    assert _to_utc_naive(aware) == datetime(2024, 1, 1)
+    assert _to_utc_naive("2024-01-01 00:00:00.1234Z") == datetime(2024, 1, 1, 0, 0, 0, 123000)
+    assert _to_utc_naive("  ") is None
+
+
+class _DT(datetime):
+    """Подкласс datetime (как pandas.Timestamp) — идёт не через быстрый путь."""
+
+
+def test_datetime_subclass_and_strptime_fallback_truncate_to_ms():
+    assert _to_utc_naive(_DT(2024, 1, 1, 0, 0, 0, 123456)) == datetime(2024, 1, 1, 0, 0, 0, 123000)
+    aware = _DT(2024, 1, 1, 5, 0, 0, 999999, tzinfo=timezone(timedelta(hours=5)))
+    got = _to_utc_naive(aware)
+    assert got == datetime(2024, 1, 1, 0, 0, 0, 999000) and got.tzinfo is None
+    # Нестандартная строка (без ведущего нуля) — strptime-ветка
+    assert _to_utc_naive("2024-1-01 00:00:00.123456") == datetime(2024, 1, 1, 0, 0, 0, 123000)
+    assert _to_utc_naive("2024-1-01T00:00:00.5Z") == datetime(2024, 1, 1, 0, 0, 0, 500000)